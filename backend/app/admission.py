@@ -0,0 +1,163 @@
+"""
+Admission control for LLM-backed endpoints.
+
+Creating a goal queues a journey generation and every tutor message asks
+for a completion, so both are admitted here before any work is queued:
+
+- a token bucket per user and endpoint class ("journey", "tutor") limits
+  how fast one user can ask for completions; RATE_LIMIT_JOURNEY="10/60"
+  allows bursts of 10 and refills 10 tokens per 60 seconds. An empty
+  bucket answers 429 with Retry-After set to when the next token is due.
+- a user who already has LLM_MAX_PENDING_PER_USER calls in flight or
+  waiting in the gateway gets 429 too, so parallel requests from one user
+  cannot fill the shared queue.
+- a global cap on outstanding LLM work (gateway calls in flight or waiting
+  for a slot, plus queued journeys) sheds requests with 503 once
+  LLM_MAX_PENDING is reached, before they pile up behind everyone else.
+  Users who already have calls outstanding are shed first, at three
+  quarters of the cap.
+
+Bucket state lives in a backend with an async take(). The default
+MemoryLimiterBackend is per process, so with N workers a user gets up to N
+times the configured rate; a shared store (e.g. Redis) can implement the
+same take() and stats() to enforce one limit across workers.
+"""
+import os
+import math
+import time
+from collections import OrderedDict
+from fastapi import Depends, HTTPException, status
+from app.middleware.auth import get_current_user
+from app.llm import llm_gateway
+from app.journeys import journey_pool
+from app.metrics import register_stats
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_JOURNEY = os.getenv("RATE_LIMIT_JOURNEY", "10/60")  # requests/seconds per user
+RATE_LIMIT_TUTOR = os.getenv("RATE_LIMIT_TUTOR", "30/60")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+LLM_MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "256"))  # 0 disables shedding
+LLM_MAX_PENDING_PER_USER = int(os.getenv("LLM_MAX_PENDING_PER_USER", "4"))  # 0 disables
+LLM_SHED_RETRY_AFTER = int(os.getenv("LLM_SHED_RETRY_AFTER", "5"))  # seconds
+
+def parse_rate(text: str):
+    """'10/60' -> (burst 10, 10/60 tokens per second)."""
+    count, _, seconds = text.partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    return count, count / seconds
+
+class MemoryLimiterBackend:
+    """Token buckets keyed by string, least recently used ones evicted past max_keys."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.evictions = 0
+
+    async def take(self, key: str, burst: float, rate: float, cost: float = 1) -> float:
+        """Take `cost` tokens. Returns 0 when allowed, otherwise seconds until they would be available."""
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            # An evicted bucket comes back full, which can only favour the user
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        return (cost - bucket[0]) / rate if rate > 0 else math.inf
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "max_keys": self.max_keys,
+                "evictions": self.evictions}
+
+LIMITER_BACKENDS = {"memory": MemoryLimiterBackend}
+
+def llm_pending() -> int:
+    return llm_gateway.in_flight + llm_gateway.waiting + journey_pool.queued
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class AdmissionController:
+    def __init__(self, backend=None, limits: dict = None, max_pending: int = LLM_MAX_PENDING,
+                 max_pending_per_user: int = LLM_MAX_PENDING_PER_USER, pending=llm_pending,
+                 user_pending=llm_gateway.user_pending, enabled: bool = RATE_LIMIT):
+        self.backend = backend or LIMITER_BACKENDS[RATE_LIMIT_BACKEND]()
+        self.limits = limits if limits is not None else {
+            "journey": parse_rate(RATE_LIMIT_JOURNEY),
+            "tutor": parse_rate(RATE_LIMIT_TUTOR)
+        }
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self.pending = pending
+        self.user_pending = user_pending
+        self.enabled = enabled
+        self.admitted = 0
+        self.limited = 0
+        self.shed = 0
+
+    async def admit(self, user_id: str, endpoint_class: str):
+        """Raise Rejected (429 over the user's rate or own pending cap, 503 when LLM work is backed up)."""
+        user_pending = self.user_pending(user_id)
+        if self.enabled and self.max_pending_per_user and user_pending >= self.max_pending_per_user:
+            self.limited += 1
+            raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "rate_limited", 1)
+        # The last quarter of the cap is kept for users with nothing outstanding, so under
+        # overload whoever retries fastest can't crowd out everyone else
+        limit = self.max_pending if not user_pending else self.max_pending - self.max_pending // 4
+        if self.max_pending and self.pending() >= limit:
+            self.shed += 1
+            raise Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, "overloaded", LLM_SHED_RETRY_AFTER)
+        # Shedding is checked first so a rejected request doesn't also spend a token
+        if self.enabled and endpoint_class in self.limits:
+            burst, rate = self.limits[endpoint_class]
+            wait = await self.backend.take(f"{endpoint_class}:{user_id}", burst, rate)
+            if wait:
+                self.limited += 1
+                raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "rate_limited", wait)
+        self.admitted += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "limits": {name: {"burst": burst, "per_second": round(rate, 4)} for name, (burst, rate) in self.limits.items()},
+            "admitted": self.admitted,
+            "limited": self.limited,
+            "shed": self.shed,
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "max_pending_per_user": self.max_pending_per_user,
+            **self.backend.stats()
+        }
+
+admission = AdmissionController()
+register_stats("admission", admission.stats, counters=("admitted", "limited", "shed"), gauges=("pending",))
+
+def admitted_user(endpoint_class: str):
+    """Dependency: the authenticated user, once admitted for `endpoint_class`."""
+    async def dependency(user_id: str = Depends(get_current_user)) -> str:
+        try:
+            await admission.admit(user_id, endpoint_class)
+        except Rejected as e:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail="Too many requests. Please slow down." if e.status_code == 429
+                else "Server is busy. Please try again shortly.",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        return user_id
+    return dependency
@@ -0,0 +1,225 @@
+"""
+Tutor answer cache with near-duplicate question matching.
+
+Learners working on the same goal ask the same things in slightly
+different words ("what is a closure?", "What's a closure"). Answers are
+cached per context under the normalized question: lowercased, common
+contractions expanded, articles and punctuation dropped. A lookup first
+tries that exact key, then looks for a near duplicate: every question is
+reduced to shingles (its words and word pairs) and a MinHash signature;
+the signatures are banded into an LSH index, and candidates sharing a
+band are accepted when the Jaccard similarity of their shingles is at
+least TUTOR_CACHE_THRESHOLD.
+
+The cache is bounded by entry count and approximate bytes and evicts the
+least recently used entry first. Entries expire after TUTOR_CACHE_TTL
+seconds, or the TTL set for their context in TUTOR_CACHE_CONTEXT_TTLS
+("python=86400,news=600"). A message sent with "cache": false skips the
+lookup and its fresh answer replaces the cached one.
+"""
+import os
+import re
+import time
+import array
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from app.metrics import register_stats
+from typing import Optional
+
+TUTOR_CACHE = os.getenv("TUTOR_CACHE", "1") == "1"
+TUTOR_CACHE_SIZE = int(os.getenv("TUTOR_CACHE_SIZE", "5000"))  # entries
+TUTOR_CACHE_MAX_BYTES = int(os.getenv("TUTOR_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TUTOR_CACHE_TTL = float(os.getenv("TUTOR_CACHE_TTL", "86400"))  # seconds
+TUTOR_CACHE_CONTEXT_TTLS = os.getenv("TUTOR_CACHE_CONTEXT_TTLS", "")  # "context=seconds,..."
+TUTOR_CACHE_THRESHOLD = float(os.getenv("TUTOR_CACHE_THRESHOLD", "0.8"))  # Jaccard similarity
+TUTOR_CACHE_SHINGLE = int(os.getenv("TUTOR_CACHE_SHINGLE", "2"))  # longest word n-gram per shingle
+
+# 8 bands of 4 rows put questions at Jaccard 0.8 in a shared band 98.6% of the time
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+ENTRY_OVERHEAD = 600  # rough bytes per entry for the key, signature, index sets and tuples
+
+CONTRACTIONS = [
+    (re.compile(r"\b(what|where|who|how|when|why|that|it|there|here)'?s\b"), r"\1 is"),
+    (re.compile(r"\bcan't\b"), "cannot"),
+    (re.compile(r"\bwon't\b"), "will not"),
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'d\b"), " would"),
+    (re.compile(r"\bi'm\b"), "i am"),
+]
+
+ARTICLES = {"a", "an", "the"}
+
+def normalize_question(question: str) -> str:
+    text = question.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    # + and # stay so "c++" and "c#" don't collapse into "c"
+    return " ".join(word for word in re.sub(r"[^\w\s+#]", " ", text).split() if word not in ARTICLES)
+
+def shingles(text: str, size: int = TUTOR_CACHE_SHINGLE) -> frozenset:
+    """Word n-grams of 1..size words."""
+    words = text.split()
+    return frozenset(" ".join(words[i:i + n]) for n in range(1, size + 1) for i in range(len(words) - n + 1))
+
+def parse_context_ttls(text: str) -> dict:
+    ttls = {}
+    for item in text.split(","):
+        context, _, seconds = item.partition("=")
+        if context.strip() and seconds.strip():
+            ttls[context.strip().lower()] = float(seconds)
+    return ttls
+
+@lru_cache(maxsize=65536)
+def shingle_hashes(shingle: str) -> tuple:
+    """One 32-bit hash per permutation, all cut from a single SHAKE digest of the shingle."""
+    digest = hashlib.shake_128(shingle.encode()).digest(4 * MINHASH_PERMUTATIONS)
+    return tuple(array.array("I", digest))
+
+def minhash(items: frozenset) -> tuple:
+    # Shingles repeat across questions, so their hashes mostly come from the LRU
+    return tuple(map(min, zip(*map(shingle_hashes, items))))
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class TutorAnswerCache:
+    def __init__(self, max_entries: int = TUTOR_CACHE_SIZE, max_bytes: int = TUTOR_CACHE_MAX_BYTES,
+                 ttl: float = TUTOR_CACHE_TTL, context_ttls: dict = None,
+                 threshold: float = TUTOR_CACHE_THRESHOLD, enabled: bool = TUTOR_CACHE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.context_ttls = context_ttls if context_ttls is not None else parse_context_ttls(TUTOR_CACHE_CONTEXT_TTLS)
+        self.threshold = threshold
+        self.enabled = enabled
+        # (context, question) -> (answer, shingles, signature, expires_at, size)
+        self._entries = OrderedDict()
+        self._bands = {}  # (context, band, rows) -> set of entry keys
+        self.bytes = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, context: str) -> float:
+        return self.context_ttls.get(context, self.ttl)
+
+    def _band_keys(self, context: str, signature: tuple):
+        for band in range(MINHASH_BANDS):
+            yield (context, band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS])
+
+    def _remove(self, key):
+        _, _, signature, _, size = self._entries.pop(key)
+        self.bytes -= size
+        for band_key in self._band_keys(key[0], signature):
+            keys = self._bands.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band_key]
+
+    def _live(self, key, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[3] <= now:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, context: str, question: str) -> Optional[str]:
+        """Cached answer to the question or a near duplicate of it in the same context."""
+        if not self.enabled:
+            return None
+        context = (context or "").strip().lower()
+        normalized = normalize_question(question)
+        key = (context, normalized)
+        now = time.monotonic()
+
+        entry = self._live(key, now)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        question_shingles = shingles(normalized)
+        if question_shingles:
+            signature = minhash(question_shingles)
+            candidates = set()
+            for band_key in self._band_keys(context, signature):
+                candidates.update(self._bands.get(band_key, ()))
+            best, best_similarity = None, self.threshold
+            for candidate in candidates:
+                entry = self._live(candidate, now)
+                if entry is None:
+                    continue
+                similarity = jaccard(question_shingles, entry[1])
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is not None:
+                self._entries.move_to_end(best)
+                self.near_hits += 1
+                return self._entries[best][0]
+
+        self.misses += 1
+        return None
+
+    def put(self, context: str, question: str, answer: str):
+        if not self.enabled or not answer:
+            return
+        context = (context or "").strip().lower()
+        ttl = self.ttl_for(context)
+        if ttl <= 0:
+            return
+        normalized = normalize_question(question)
+        question_shingles = shingles(normalized)
+        if not question_shingles:
+            return
+        key = (context, normalized)
+        size = len(answer) + len(normalized) * 2 + len(question_shingles) * 60 + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+
+        signature = minhash(question_shingles)
+        self._entries[key] = (answer, question_shingles, signature, time.monotonic() + ttl, size)
+        self.bytes += size
+        for band_key in self._band_keys(context, signature):
+            self._bands.setdefault(band_key, set()).add(key)
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "threshold": self.threshold
+        }
+
+answer_cache = TutorAnswerCache()
+register_stats("tutor_cache", answer_cache.stats, counters=("hits", "near_hits", "misses", "bypassed", "evictions"),
+               gauges=("entries", "bytes"))
@@ -1,3 +1,7 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 import bcrypt  # Use direct bcrypt
@@ -7,6 +11,12 @@ SECRET_KEY = "your-super-secret-jwt-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Password hashing settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_EXECUTOR = os.getenv("PASSWORD_EXECUTOR", "thread")  # "thread" or "process"
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "4"))
+PASSWORD_QUEUE_DEPTH = int(os.getenv("PASSWORD_QUEUE_DEPTH", "32"))
+
 def verify_password(plain_password, hashed_password):
     # Direct bcrypt verification
     if isinstance(hashed_password, str):
@@ -15,11 +25,81 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     # Direct bcrypt hashing
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+class PasswordPoolSaturated(Exception):
+    """Raised when the password executor already has its maximum amount of queued work."""
+
+class PasswordExecutor:
+    """
+    Runs bcrypt work off the event loop on a bounded pool.
+
+    At most ``workers`` hashes run at once and at most ``queue_depth`` more
+    wait for a worker; anything beyond that is rejected immediately with
+    PasswordPoolSaturated so callers can answer 503 instead of piling up.
+    """
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_depth: int = PASSWORD_QUEUE_DEPTH,
+                 kind: str = PASSWORD_EXECUTOR):
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.kind = kind
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise PasswordPoolSaturated()
+            self._pending += 1
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # Release the slot when the worker finishes, not when the caller stops
+        # waiting, so cancelled requests still count until their hash is done
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+password_executor = PasswordExecutor()
+
+async def hash_password(password: str) -> str:
+    return await password_executor.run(get_password_hash, password)
+
+async def check_password(plain_password: str, hashed_password) -> bool:
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
\ No newline at end of file
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -0,0 +1,257 @@
+"""
+Check-in ingestion.
+
+Check-ins arrive in bursts at the start of each week. With CHECKIN_BUFFER=1
+checkin_writer keeps them in a write-behind buffer and stores them with one
+insert_many per batch: a flush runs when CHECKIN_BATCH_SIZE check-ins are
+waiting or every CHECKIN_FLUSH_INTERVAL seconds. Callers choose an ack mode:
+"durable" waits until its check-ins are in MongoDB, "buffered" returns as
+soon as they are queued. Without the buffer every write goes straight to
+insert_many.
+
+A failed flush keeps its check-ins queued for the next one. On shutdown
+the buffer is flushed, and whatever still cannot be written is spilled to
+CHECKIN_SPILL_PATH and replayed on the next start. A retried check-in
+keeps the _id of its first attempt, so it is stored and counted once even
+when that attempt partly succeeded.
+"""
+import os
+import json
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from app.database import get_database
+from app.user_stats import record_checkins
+from app.goal_cache import goal_cache
+from app.log import get_logger
+from app.metrics import register_stats
+
+log = get_logger("app.checkins")
+
+CHECKIN_BUFFER = os.getenv("CHECKIN_BUFFER", "0") == "1"
+CHECKIN_BATCH_SIZE = int(os.getenv("CHECKIN_BATCH_SIZE", "500"))
+CHECKIN_FLUSH_INTERVAL = float(os.getenv("CHECKIN_FLUSH_INTERVAL", "1.0"))  # seconds
+CHECKIN_MAX_PENDING = int(os.getenv("CHECKIN_MAX_PENDING", "20000"))
+CHECKIN_ACK = os.getenv("CHECKIN_ACK", "durable")  # "durable" or "buffered"
+CHECKIN_ACK_TIMEOUT = float(os.getenv("CHECKIN_ACK_TIMEOUT", "5"))  # seconds a durable ack waits
+CHECKIN_SPILL_PATH = os.getenv("CHECKIN_SPILL_PATH", "checkins.spill.jsonl")
+
+DUPLICATE_KEY = 11000
+
+async def _already_stored(db, checkins: list) -> set:
+    """_ids of retried check-ins that an earlier, partly failed attempt did store."""
+    # insert_many gives each document its _id before sending it, so only a
+    # check-in that went through a failed flush or a spill carries one. A
+    # time-series collection has no unique _id index to reject it on replay.
+    retried = [c for c in checkins if "_id" in c]
+    if not retried:
+        return set()
+    dates = [c["checkin_date"] for c in retried]
+    cursor = db.checkins.find(
+        {"_id": {"$in": [c["_id"] for c in retried]}, "checkin_date": {"$gte": min(dates), "$lte": max(dates)}},
+        {"_id": 1}
+    )
+    return {doc["_id"] async for doc in cursor}
+
+async def store_checkins(db, checkins: list) -> int:
+    """
+    insert_many the check-ins and fold the ones actually inserted into each
+    user's stats. Returns how many were inserted.
+    """
+    stored = await _already_stored(db, checkins)
+    checkins = [c for c in checkins if c.get("_id") not in stored] if stored else checkins
+    if not checkins:
+        return 0
+
+    failed, error = set(), None
+    try:
+        await db.checkins.insert_many(checkins, ordered=False)
+    except BulkWriteError as e:
+        # A retried batch may already be partly stored; those come back as duplicate _ids
+        write_errors = e.details.get("writeErrors", [])
+        failed = {write_error["index"] for write_error in write_errors}
+        if any(write_error.get("code") != DUPLICATE_KEY for write_error in write_errors):
+            error = e
+        log.info("checkins_partly_inserted", inserted=e.details.get("nInserted", 0), failed=len(failed))
+    inserted = [c for i, c in enumerate(checkins) if i not in failed]
+
+    # Count what did go in even when the batch is retried for the rest; the
+    # retry skips these by _id, so nothing is counted twice
+    if inserted:
+        # A check-in changes what its goal's progress looks like, so it invalidates the goal's ETag
+        goal_ids = {ObjectId(c["goal_id"]) for c in inserted if ObjectId.is_valid(c.get("goal_id") or "")}
+        if goal_ids:
+            await db.goals.update_many({"_id": {"$in": list(goal_ids)}}, {"$inc": {"version": 1}})
+
+        latest = defaultdict(lambda: [0, None])
+        for checkin in inserted:
+            entry = latest[checkin["user_id"]]
+            entry[0] += 1
+            entry[1] = max(entry[1] or checkin["checkin_date"], checkin["checkin_date"])
+        for user_id, (count, last_checkin_at) in latest.items():
+            await goal_cache.invalidate(user_id)
+            await record_checkins(db, user_id, last_checkin_at, count)
+    if error is not None:
+        raise error
+    return len(inserted)
+
+def _spill_record(checkin: dict) -> str:
+    record = dict(checkin)
+    if "_id" in record:
+        record["_id"] = str(record["_id"])
+    record["checkin_date"] = record["checkin_date"].isoformat()
+    return json.dumps(record)
+
+def _unspill_record(line: str) -> dict:
+    checkin = json.loads(line)
+    if "_id" in checkin:
+        checkin["_id"] = ObjectId(checkin["_id"])
+    checkin["checkin_date"] = datetime.fromisoformat(checkin["checkin_date"])
+    return checkin
+
+class CheckinWriter:
+    def __init__(self, enabled: bool = CHECKIN_BUFFER, batch_size: int = CHECKIN_BATCH_SIZE,
+                 flush_interval: float = CHECKIN_FLUSH_INTERVAL, max_pending: int = CHECKIN_MAX_PENDING,
+                 spill_path: str = CHECKIN_SPILL_PATH):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.pending = []
+        self.waiters = []  # futures of durable writes waiting on the pending check-ins
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.spilled = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._replay_spill()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher, write out the buffer and spill whatever could not be written."""
+        if self._task is None:
+            return
+        # Let a flush that is under way finish instead of cancelling it mid-insert
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        await self.flush()
+        if self.pending:
+            self._spill()
+
+    async def write(self, checkins: list, durable: bool = True) -> bool:
+        """
+        Store or queue `checkins`. Returns True once they are in MongoDB, or
+        False if they are only queued (buffered ack, or a durable ack that
+        timed out waiting for a flush).
+        """
+        if not self.running:
+            self.written += await store_checkins(get_database(), checkins)
+            return True
+
+        if len(self.pending) + len(checkins) > self.max_pending:
+            # Apply backpressure rather than let the buffer grow without bound
+            await self.flush()
+
+        self.pending.extend(checkins)
+        waiter = None
+        if durable:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+        if waiter is None:
+            return False
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), CHECKIN_ACK_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            if not self.pending:
+                return True
+            batch, self.pending = self.pending, []
+            waiters, self.waiters = self.waiters, []
+            try:
+                written = await store_checkins(get_database(), batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                log.error("checkin_flush_failed", batch=len(batch), error=str(e))
+                # Put the batch back in front of anything queued meanwhile
+                self.waiters = waiters + self.waiters
+                self.pending = batch + self.pending
+                return False
+
+            self.flushes += 1
+            self.written += written
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(True)
+            return True
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _spill(self):
+        try:
+            with open(self.spill_path, "a") as f:
+                for checkin in self.pending:
+                    f.write(_spill_record(checkin) + "\n")
+        except OSError as e:
+            log.error("checkin_spill_failed", pending=len(self.pending), path=self.spill_path, error=str(e))
+            return
+        log.warning("checkins_spilled", pending=len(self.pending), path=self.spill_path)
+        self.spilled += len(self.pending)
+        self.pending = []
+
+    def _replay_spill(self):
+        if not os.path.exists(self.spill_path):
+            return
+        with open(self.spill_path) as f:
+            checkins = [_unspill_record(line) for line in f if line.strip()]
+        os.remove(self.spill_path)
+        self.pending = checkins + self.pending
+        log.info("checkins_replayed", count=len(checkins), path=self.spill_path)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": self.running,
+            "pending": len(self.pending),
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "spilled": self.spilled,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval
+        }
+
+checkin_writer = CheckinWriter()
+register_stats("checkin_writer", checkin_writer.stats, counters=("written", "flushes", "failed_flushes", "spilled"),
+               gauges=("pending",))
@@ -0,0 +1,304 @@
+"""
+Tutor conversation memory.
+
+Each user's conversation in a context (usually a goal) is kept so the
+tutor sees what was said before, within a hard budget of
+TUTOR_HISTORY_TOKENS prompt tokens:
+
+- the most recent turns are kept verbatim, up to TUTOR_HISTORY_RECENT_TOKENS;
+- older turns are folded into a rolling summary that gets the rest of the
+  budget. Folding is extractive: it keeps the first sentence of each
+  folded turn and drops the oldest lines once over budget, so the budget
+  holds as soon as a turn is recorded. With TUTOR_HISTORY_SUMMARY=llm the
+  model then rewrites the summary in a background task, one per
+  conversation, which never delays an answer; the extractive summary
+  stays if that call fails or the conversation moves on meanwhile.
+
+Tokens are estimated at 4 characters each; no tokenizer is involved.
+
+Conversations live in a backend with async get/set/delete on plain dicts.
+The default MemoryConversationBackend keeps up to TUTOR_HISTORY_SESSIONS
+conversations and TUTOR_HISTORY_MAX_BYTES per worker, least recently used
+first out, and drops conversations idle for TUTOR_HISTORY_IDLE_TTL
+seconds. A reconnect to the same worker picks its conversation back up; a
+shared store (e.g. Redis) implementing the same methods and stats() makes
+that work across workers.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+from app.llm import llm_gateway, LLMError
+from app.log import get_logger
+from app.metrics import register_stats
+
+log = get_logger("app.conversations")
+
+TUTOR_HISTORY = os.getenv("TUTOR_HISTORY", "1") == "1"
+TUTOR_HISTORY_BACKEND = os.getenv("TUTOR_HISTORY_BACKEND", "memory")
+TUTOR_HISTORY_TOKENS = int(os.getenv("TUTOR_HISTORY_TOKENS", "1200"))  # summary + recent turns
+TUTOR_HISTORY_RECENT_TOKENS = int(os.getenv("TUTOR_HISTORY_RECENT_TOKENS", "800"))  # verbatim turns
+TUTOR_HISTORY_SUMMARY = os.getenv("TUTOR_HISTORY_SUMMARY", "extractive")  # "extractive" or "llm"
+TUTOR_HISTORY_SESSIONS = int(os.getenv("TUTOR_HISTORY_SESSIONS", "10000"))  # conversations per worker
+TUTOR_HISTORY_MAX_BYTES = int(os.getenv("TUTOR_HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))
+TUTOR_HISTORY_IDLE_TTL = float(os.getenv("TUTOR_HISTORY_IDLE_TTL", "1800"))  # seconds
+
+CHARS_PER_TOKEN = 4
+SUMMARY_LINE_WORDS = 30
+SUMMARY_REWRITE_ATTEMPTS = 3  # retries when new turns are folded while a rewrite is running
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clip_tokens(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens, keeping the start."""
+    limit = tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(0, limit - 1)].rstrip() + "…"
+
+def summary_line(role: str, text: str) -> str:
+    first = SENTENCE_END.split(" ".join(text.split()), 1)[0]
+    words = first.split()
+    if len(words) > SUMMARY_LINE_WORDS:
+        first = " ".join(words[:SUMMARY_LINE_WORDS]) + "…"
+    return f"{'Learner' if role == 'user' else 'Tutor'}: {first}"
+
+class MemoryConversationBackend:
+    """LRU store of conversation dicts bounded by count and serialized size, with an idle TTL."""
+
+    def __init__(self, max_sessions: int = TUTOR_HISTORY_SESSIONS, max_bytes: int = TUTOR_HISTORY_MAX_BYTES,
+                 idle_ttl: float = TUTOR_HISTORY_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()  # key -> (last_used, size, state)
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def _expire(self, now: float):
+        # Least recently used first, so idle conversations sit at the front
+        while self._entries:
+            key, (last_used, _, _) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._remove(key)
+            self.expirations += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries[key] = (now, entry[1], entry[2])
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    async def set(self, key: str, state: dict):
+        now = time.monotonic()
+        size = len(json.dumps(state))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (now, size, state)
+        self.bytes += size
+        self._expire(now)
+        while len(self._entries) > self.max_sessions or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+CONVERSATION_BACKENDS = {"memory": MemoryConversationBackend}
+
+class Conversation:
+    """One user's conversation in one context: a rolling summary plus recent turns."""
+
+    __slots__ = ("key", "summary", "turns")
+
+    def __init__(self, key: str, summary: str = "", turns: list = None):
+        self.key = key
+        self.summary = summary
+        self.turns = turns or []  # [role, text] pairs, oldest first
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(text) for _, text in self.turns)
+
+    def messages(self) -> list:
+        """Chat messages to put between the system prompt and the new question."""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{self.summary}"})
+        messages.extend({"role": role, "content": text} for role, text in self.turns)
+        return messages
+
+    def state(self) -> dict:
+        return {"summary": self.summary, "turns": self.turns}
+
+class ConversationStore:
+    def __init__(self, backend=None, budget: int = TUTOR_HISTORY_TOKENS,
+                 recent_budget: int = TUTOR_HISTORY_RECENT_TOKENS, summary_mode: str = TUTOR_HISTORY_SUMMARY,
+                 enabled: bool = TUTOR_HISTORY):
+        self.backend = backend or CONVERSATION_BACKENDS[TUTOR_HISTORY_BACKEND]()
+        self.budget = budget
+        self.recent_budget = min(recent_budget, budget)
+        self.summary_budget = budget - self.recent_budget
+        self.summary_mode = summary_mode
+        self.enabled = enabled
+        self.compactions = 0
+        self.llm_summaries = 0
+        self.llm_summary_failures = 0
+        self._rewrites = {}  # key -> background summary rewrite task
+        self._folded = {}  # key -> turns folded since the summary was last rewritten
+
+    @staticmethod
+    def key(user_id: str, context: str) -> str:
+        return f"{user_id}:{(context or '').strip().lower()}"
+
+    async def load(self, user_id: str, context: str) -> Optional[Conversation]:
+        """The user's conversation in this context, or None with history turned off."""
+        if not self.enabled:
+            return None
+        key = self.key(user_id, context)
+        try:
+            state = await self.backend.get(key)
+        except Exception as e:
+            log.error("conversation_load_failed", key=key, error=str(e))
+            state = None
+        if state is None:
+            return Conversation(key)
+        return Conversation(key, state["summary"], [list(turn) for turn in state["turns"]])
+
+    async def record(self, conversation: Conversation, question: str, answer: str):
+        """Add a question and its answer, compact to the budget and save."""
+        conversation.turns.append(["user", question])
+        conversation.turns.append(["assistant", answer])
+        folded = self._compact(conversation)
+        try:
+            await self.backend.set(conversation.key, conversation.state())
+        except Exception as e:
+            log.error("conversation_save_failed", key=conversation.key, error=str(e))
+            return
+        if folded and self.summary_mode == "llm":
+            self._rewrite_later(conversation.key, folded)
+
+    async def reset(self, user_id: str, context: str):
+        key = self.key(user_id, context)
+        self._folded.pop(key, None)
+        await self.backend.delete(key)
+
+    def _compact(self, conversation: Conversation) -> list:
+        """Fold turns beyond the recent budget into the summary; returns the folded turns."""
+        recent = sum(estimate_tokens(text) for _, text in conversation.turns)
+        folded = []
+        # Keep at least the latest exchange verbatim, clipped if it alone is over budget
+        while recent > self.recent_budget and len(conversation.turns) > 2:
+            role, text = conversation.turns.pop(0)
+            recent -= estimate_tokens(text)
+            folded.append((role, text))
+        if recent > self.recent_budget:
+            share = self.recent_budget // 2
+            conversation.turns = [[role, clip_tokens(text, share)] for role, text in conversation.turns]
+        if not folded:
+            return folded
+
+        self.compactions += 1
+        lines = conversation.summary.splitlines() + [summary_line(role, text) for role, text in folded]
+        while lines and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        conversation.summary = clip_tokens("\n".join(lines), self.summary_budget)
+        return folded
+
+    def _rewrite_later(self, key: str, folded: list):
+        pending = self._folded.setdefault(key, [])
+        pending.extend(folded)
+        # Turns waiting on a failing model are kept only up to a budget's worth
+        while len(pending) > 1 and sum(estimate_tokens(text) for _, text in pending) > self.budget:
+            pending.pop(0)
+        if key not in self._rewrites:
+            task = asyncio.create_task(self._rewrite(key))
+            self._rewrites[key] = task
+            task.add_done_callback(lambda _: self._rewrites.pop(key, None))
+
+    async def _rewrite(self, key: str):
+        """Replace the extractive summary with the model's, unless the conversation changed meanwhile."""
+        try:
+            for _ in range(SUMMARY_REWRITE_ATTEMPTS):
+                folded = list(self._folded.get(key, ()))
+                state = await self.backend.get(key)
+                if not folded or state is None:
+                    return
+                before = state["summary"]
+                summary = await self._llm_summary(before, folded)
+                if summary is None:
+                    return
+                current = await self.backend.get(key)
+                if current is None:
+                    return
+                if current["summary"] != before:
+                    # More turns were folded while the model was busy; summarize them all again
+                    continue
+                await self.backend.set(key, {**current, "summary": clip_tokens(summary, self.summary_budget)})
+                return
+        except Exception as e:
+            log.error("conversation_summary_rewrite_failed", key=key, error=str(e))
+        finally:
+            self._folded.pop(key, None)
+
+    async def _llm_summary(self, summary: str, folded: list) -> Optional[str]:
+        transcript = "\n".join(f"{'Learner' if role == 'user' else 'Tutor'}: {text}" for role, text in folded)
+        try:
+            result = await llm_gateway.complete([
+                {"role": "system", "content": "Summarize this tutoring conversation in a few short lines. "
+                                              "Keep the learner's goals, open questions and what was explained."},
+                {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+            ], max_tokens=self.summary_budget, temperature=0.2)
+        except LLMError as e:
+            self.llm_summary_failures += 1
+            log.warning("conversation_summary_failed", error_type=type(e).__name__, error=str(e))
+            return None
+        self.llm_summaries += 1
+        return result.strip()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "budget": self.budget,
+            "recent_budget": self.recent_budget,
+            "summary_budget": self.summary_budget,
+            "summary_mode": self.summary_mode,
+            "compactions": self.compactions,
+            "llm_summaries": self.llm_summaries,
+            "llm_summary_failures": self.llm_summary_failures,
+            "summary_rewrites_running": len(self._rewrites),
+            **self.backend.stats()
+        }
+
+conversation_store = ConversationStore()
+register_stats("tutor_history", conversation_store.stats, counters=("compactions", "evictions", "expirations"),
+               gauges=("sessions", "bytes"))
@@ -1,36 +1,82 @@
 import os
+import time
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import ConnectionFailure
-import asyncio
+from app.log import get_logger
+from app.metrics import MongoCommandListener
+
+log = get_logger("app.database")
 
 # MongoDB connection string
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DB = os.getenv("MONGODB_DB", "goallab")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))  # 0 keeps idle connections
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0"))  # 0 waits for a connection forever
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+client = None
+database = None
+
+def connect():
+    """Create the Motor client. Called from the app lifespan, or lazily by get_database() in scripts."""
+    global client, database
+    if client is not None:
+        return database
+
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS
+    }
+    if MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+    if MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = MONGO_WAIT_QUEUE_TIMEOUT_MS
+    options["event_listeners"] = [MongoCommandListener()]
 
-try:
-    client = AsyncIOMotorClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
-    database = client.goallab
-    print("✅ MongoDB client created successfully")
-except Exception as e:
-    print(f"❌ MongoDB connection error: {e}")
-    # Fallback to None to prevent crashes
+    client = AsyncIOMotorClient(MONGODB_URL, **options)
+    database = client[MONGODB_DB]
+    log.info("mongo_client_created", db=MONGODB_DB, min_pool=MONGO_MIN_POOL_SIZE, max_pool=MONGO_MAX_POOL_SIZE)
+    return database
+
+def close():
+    global client, database
+    if client is not None:
+        client.close()
     client = None
     database = None
 
 def get_database():
     if database is None:
-        raise Exception("Database not connected")
+        return connect()
     return database
 
+async def ping(timeout: float = 2.0) -> dict:
+    """Round-trip a ping to the server; returns {"ok": bool, "latency_ms" or "error"}."""
+    if client is None:
+        return {"ok": False, "error": "client not created"}
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"no answer within {timeout}s"}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+
 async def test_connection():
     try:
         if client is None:
             return False
         await client.admin.command('ping')
-        print("✅ MongoDB connection successful!")
+        log.info("mongo_connected")
         return True
     except ConnectionFailure:
-        print("❌ MongoDB connection failed: Cannot connect to server")
+        log.error("mongo_unreachable", error="cannot connect to server")
         return False
     except Exception as e:
-        print(f"❌ MongoDB connection error: {e}")
-        return False
\ No newline at end of file
+        log.error("mongo_connection_error", error=str(e))
+        return False
@@ -0,0 +1,148 @@
+"""
+Per-user read cache for goal responses.
+
+GET /api/goals pages and GET /api/goals/{id} bodies are cached as the
+serialized JSON the routes send, keyed by user. Every user has a generation
+number that is part of each key; a write to any of the user's goals moves
+the generation forward, so all of that user's cached entries become
+unreachable at once and age out through TTL and LRU eviction. Because a
+reader takes the generation before it queries MongoDB, a read racing with
+a write can only ever fill an already-stale generation.
+
+Entries live in a backend with async get/set/delete on bytes. The default
+MemoryCacheBackend is bounded by entry count and bytes; a shared store
+(e.g. Redis) can implement the same three methods and stats() to give all
+workers one cache. With the in-process backend each worker invalidates
+only its own copy, so other workers may serve a goal up to GOAL_CACHE_TTL
+seconds old.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.metrics import register_stats
+
+GOAL_CACHE = os.getenv("GOAL_CACHE", "1") == "1"
+GOAL_CACHE_BACKEND = os.getenv("GOAL_CACHE_BACKEND", "memory")
+GOAL_CACHE_SIZE = int(os.getenv("GOAL_CACHE_SIZE", "10000"))  # entries
+GOAL_CACHE_MAX_BYTES = int(os.getenv("GOAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+GOAL_CACHE_TTL = float(os.getenv("GOAL_CACHE_TTL", "30"))  # seconds
+
+ENTRY_OVERHEAD = 200  # rough bytes per entry for the key, tuple and OrderedDict node
+
+class MemoryCacheBackend:
+    """LRU + TTL store of bytes values bounded by entry count and total size."""
+
+    def __init__(self, max_entries: int = GOAL_CACHE_SIZE, max_bytes: int = GOAL_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _size(self, key: str, value: bytes) -> int:
+        return len(key) + len(value) + ENTRY_OVERHEAD
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self.bytes -= self._size(key, value)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl if ttl else None, value)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+CACHE_BACKENDS = {"memory": MemoryCacheBackend}
+
+class GoalCache:
+    def __init__(self, backend=None, ttl: float = GOAL_CACHE_TTL, enabled: bool = GOAL_CACHE):
+        self.backend = backend or CACHE_BACKENDS[GOAL_CACHE_BACKEND]()
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def generation(self, user_id: str) -> int:
+        value = await self.backend.get(f"gen:{user_id}")
+        if value is not None:
+            return int(value)
+        # A generation that was evicted restarts from the clock, which is
+        # past any generation handed out before, so old entries stay dead
+        generation = time.time_ns()
+        await self.backend.set(f"gen:{user_id}", str(generation).encode())
+        return generation
+
+    async def get(self, user_id: str, generation: int, name: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        value = await self.backend.get(f"{user_id}:{generation}:{name}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def put(self, user_id: str, generation: int, name: str, value: bytes):
+        if self.enabled:
+            await self.backend.set(f"{user_id}:{generation}:{name}", value, self.ttl)
+
+    async def invalidate(self, user_id: str):
+        """Drop everything cached for the user; call after any write to their goals."""
+        if not self.enabled:
+            return
+        current = await self.backend.get(f"gen:{user_id}")
+        generation = max(int(current) + 1 if current is not None else 0, time.time_ns())
+        await self.backend.set(f"gen:{user_id}", str(generation).encode())
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "ttl": self.ttl,
+            **self.backend.stats()
+        }
+
+goal_cache = GoalCache()
+register_stats("goal_cache", goal_cache.stats, counters=("hits", "misses", "invalidations", "evictions"),
+               gauges=("entries", "bytes"))
@@ -0,0 +1,218 @@
+"""
+MongoDB index declarations and bootstrap.
+
+Every query on a hot path should be covered by an index declared here.
+ensure_indexes() runs from the app lifespan and creates whatever is missing;
+check_query_plans() explains each hot query and reports any that still
+fall back to a collection scan.
+
+    python -m app.indexes           # create missing indexes, print drift
+    python -m app.indexes --check   # also explain hot queries, exit 1 on COLLSCAN
+    python -m app.indexes --migrate-checkins   # move checkins into a time-series collection
+
+With CHECKIN_TIMESERIES=1 a fresh database gets `checkins` as a MongoDB
+time-series collection (time field checkin_date, meta field goal_id), which
+keeps per-goal date-range reads and storage cheap as history grows. An
+existing regular collection is left alone until --migrate-checkins copies it
+over; the old documents stay in checkins_legacy until dropped by hand.
+"""
+import os
+import sys
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+from app.log import get_logger
+
+log = get_logger("app.indexes")
+
+INDEX_BOOTSTRAP = os.getenv("INDEX_BOOTSTRAP", "1") == "1"
+CHECKIN_TIMESERIES = os.getenv("CHECKIN_TIMESERIES", "0") == "1"
+MIGRATE_BATCH_SIZE = 1000
+
+CHECKINS_TIMESERIES = {"timeseries": {"timeField": "checkin_date", "metaField": "goal_id", "granularity": "hours"}}
+
+# Collections that need options at creation time, before the first insert
+COLLECTIONS = {}
+if CHECKIN_TIMESERIES:
+    COLLECTIONS["checkins"] = CHECKINS_TIMESERIES
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "goals": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+                   name="user_id_created_at_id"),
+        # Only goals waiting for a journey, for startup recovery
+        IndexModel([("status", ASCENDING)], name="status_generating",
+                   partialFilterExpression={"status": "generating"}),
+        # Goal search; the user_id prefix keeps each query to one user's entries.
+        # Weights match app.search.FIELD_WEIGHTS
+        IndexModel([("user_id", ASCENDING), ("title", TEXT), ("category", TEXT), ("description", TEXT),
+                    ("milestones.objective", TEXT)], name="user_id_text",
+                   weights={"title": 10, "category": 5, "description": 2, "milestones.objective": 1}),
+    ],
+    "journey_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "checkins": [
+        IndexModel([("goal_id", ASCENDING), ("checkin_date", DESCENDING)], name="goal_id_checkin_date"),
+        IndexModel([("user_id", ASCENDING), ("checkin_date", DESCENDING)], name="user_id_checkin_date"),
+    ],
+}
+
+# (collection, filter, sort) for every query the API runs per request
+HOT_QUERIES = [
+    ("users", {"email": "explain@example.com"}, None),
+    ("goals", {"user_id": "explain-user"}, None),
+    ("goals", {"user_id": "explain-user"}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("goals", {"user_id": "explain-user", "$or": [
+        {"created_at": {"$lt": datetime(2030, 1, 1)}},
+        {"created_at": datetime(2030, 1, 1), "_id": {"$lt": ObjectId()}}
+    ]}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+    ("goals", {"_id": ObjectId(), "user_id": "explain-user"}, None),
+    ("goals", {"user_id": "explain-user", "$text": {"$search": "explain"}}, None),
+    ("checkins", {"goal_id": "explain-goal"}, None),
+    ("checkins", {"goal_id": "explain-goal"}, [("checkin_date", DESCENDING)]),
+    ("user_stats", {"_id": "explain-user"}, None),
+]
+
+def _spec(key, unique) -> tuple:
+    fields = []
+    for field, direction in key:
+        # MongoDB reports every text field of an index as the pair _fts/_ftsx
+        if direction == TEXT or field in ("_fts", "_ftsx"):
+            if ("_fts", TEXT) not in fields:
+                fields += [("_fts", TEXT), ("_ftsx", 1)]
+            continue
+        fields.append((field, int(direction) if isinstance(direction, (int, float)) else direction))
+    return tuple(fields), bool(unique)
+
+async def index_drift(db) -> dict:
+    """
+    Compare declared indexes with what exists in the database.
+
+    Returns {collection: {"missing": [...], "conflicting": [...], "extra": [...]}}
+    for collections that differ from the declarations.
+    """
+    report = {}
+    for collection, models in INDEXES.items():
+        existing = await db[collection].index_information()
+        declared = {model.document["name"]: model.document for model in models}
+
+        missing, conflicting = [], []
+        for name, document in declared.items():
+            if name not in existing:
+                missing.append(name)
+            elif _spec(existing[name]["key"], existing[name].get("unique")) != \
+                    _spec(document["key"].items(), document.get("unique")):
+                conflicting.append(name)
+        extra = [name for name in existing if name != "_id_" and name not in declared]
+
+        if missing or conflicting or extra:
+            report[collection] = {"missing": missing, "conflicting": conflicting, "extra": extra}
+    return report
+
+async def _collection_info(db, name: str):
+    result = await db.command("listCollections", filter={"name": name})
+    batch = result["cursor"]["firstBatch"]
+    return batch[0] if batch else None
+
+async def ensure_collections(db):
+    """Create collections declared with options, warning about ones that exist with a different type."""
+    for name, options in COLLECTIONS.items():
+        info = await _collection_info(db, name)
+        if info is None:
+            await db.create_collection(name, **options)
+            log.info("collection_created", collection=name, timeseries="timeseries" in options)
+        elif "timeseries" in options and info.get("type") != "timeseries":
+            log.warning("collection_not_timeseries", collection=name, fix="python -m app.indexes --migrate-checkins")
+
+async def migrate_checkins(db) -> int:
+    """Move a regular checkins collection into a new time-series one, keeping the original as checkins_legacy."""
+    info = await _collection_info(db, "checkins")
+    if info is not None and info.get("type") == "timeseries":
+        return 0
+    if info is not None:
+        await db.checkins.rename("checkins_legacy")
+    await db.create_collection("checkins", **CHECKINS_TIMESERIES)
+    if info is None:
+        return 0
+
+    copied, batch = 0, []
+    # Time-series documents need a date in the time field
+    async for doc in db.checkins_legacy.find({"checkin_date": {"$type": "date"}}):
+        batch.append(doc)
+        if len(batch) >= MIGRATE_BATCH_SIZE:
+            await db.checkins.insert_many(batch, ordered=False)
+            copied, batch = copied + len(batch), []
+    if batch:
+        await db.checkins.insert_many(batch, ordered=False)
+        copied += len(batch)
+    return copied
+
+async def ensure_indexes(db) -> dict:
+    """Create declared collections and indexes that are missing and return the index drift found beforehand."""
+    await ensure_collections(db)
+    drift = await index_drift(db)
+    for collection, changes in drift.items():
+        to_create = [m for m in INDEXES[collection] if m.document["name"] in changes["missing"]]
+        if to_create:
+            try:
+                await db[collection].create_indexes(to_create)
+                log.info("indexes_created", collection=collection, indexes=",".join(changes["missing"]))
+            except OperationFailure as e:
+                log.error("index_creation_failed", collection=collection, error=str(e))
+        if changes["conflicting"]:
+            log.error("index_conflict", collection=collection, indexes=",".join(changes["conflicting"]))
+        if changes["extra"]:
+            log.warning("index_undeclared", collection=collection, indexes=",".join(changes["extra"]))
+    return drift
+
+def _plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def check_query_plans(db) -> list:
+    """Explain every hot query and return the ones whose winning plan is a COLLSCAN."""
+    offenders = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        stages = _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            offenders.append({"collection": collection, "filter": query, "sort": sort, "stages": stages})
+    return offenders
+
+async def _main(check: bool, migrate: bool = False) -> int:
+    from app.database import get_database
+
+    db = get_database()
+    if migrate:
+        copied = await migrate_checkins(db)
+        print(f"✅ Copied {copied} check-ins into the time-series collection")
+    await ensure_indexes(db)
+    if not check:
+        return 0
+
+    offenders = await check_query_plans(db)
+    for offender in offenders:
+        print(f"❌ COLLSCAN on {offender['collection']}: filter={offender['filter']} sort={offender['sort']}")
+    if not offenders:
+        print(f"✅ All {len(HOT_QUERIES)} hot queries use an index")
+    return 1 if offenders else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main("--check" in sys.argv[1:], migrate="--migrate-checkins" in sys.argv[1:])))
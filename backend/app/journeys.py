@@ -0,0 +1,407 @@
+"""
+Background learning-journey generation.
+
+create_goal stores the goal with status "generating" and submits a job to
+journey_pool. A fixed set of async workers asks the LLM for milestones,
+retrying with backoff, and falls back to a deterministic template when the
+LLM keeps failing. The finished milestones are written back to the goal.
+Identical requests (same normalized title, complexity and duration) are
+served from journey_cache instead of a fresh completion.
+
+A generating goal carries a lease (journey_lease_until) for as long as one
+process owns its job. On start each process re-queues only the generating
+goals whose lease it wins, so goals left behind by a stopped process are
+picked up once, not by every worker.
+"""
+import os
+import re
+import copy
+import json
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.database import get_database
+from app.llm import llm_gateway
+from app.user_stats import record_goal_change
+from app.goal_cache import goal_cache
+from app.search import goal_search
+from app.log import get_logger
+from app.metrics import register_stats
+
+log = get_logger("app.journeys")
+
+JOURNEY_WORKERS = int(os.getenv("JOURNEY_WORKERS", "4"))
+JOURNEY_QUEUE_SIZE = int(os.getenv("JOURNEY_QUEUE_SIZE", "1000"))
+JOURNEY_MAX_ATTEMPTS = int(os.getenv("JOURNEY_MAX_ATTEMPTS", "3"))
+JOURNEY_RETRY_DELAY = float(os.getenv("JOURNEY_RETRY_DELAY", "1.0"))  # seconds, doubled per attempt
+JOURNEY_LLM_TIMEOUT = float(os.getenv("JOURNEY_LLM_TIMEOUT", "60"))  # seconds per attempt
+JOURNEY_CACHE_SIZE = int(os.getenv("JOURNEY_CACHE_SIZE", "2000"))
+JOURNEY_CACHE_TTL = int(os.getenv("JOURNEY_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+JOURNEY_CACHE_PERSIST = os.getenv("JOURNEY_CACHE_PERSIST", "0") == "1"
+JOURNEY_LEASE = float(os.getenv("JOURNEY_LEASE", "900"))  # seconds a process owns a goal it is generating
+
+GENERATING = "generating"
+
+def journey_lease() -> datetime:
+    return datetime.now() + timedelta(seconds=JOURNEY_LEASE)
+
+def journey_prompt(title: str, complexity: str, duration: int) -> str:
+    return f"""
+        Create a {complexity} level learning journey for: {title}
+        Duration: {duration} weeks
+        Break it into weekly milestones with specific learning objectives.
+        Return ONLY valid JSON format with this structure:
+        {{
+            "milestones": [
+                {{
+                    "week": 1,
+                    "objective": "specific learning objective",
+                    "dependencies": [],
+                    "resources": ["resource1", "resource2"]
+                }}
+            ]
+        }}
+        """
+
+def parse_journey(result: str) -> dict:
+    json_start = result.find('{')
+    json_end = result.rfind('}') + 1
+    journey = json.loads(result[json_start:json_end])
+    if not isinstance(journey.get("milestones"), list) or not journey["milestones"]:
+        raise ValueError("Journey has no milestones")
+    return journey
+
+def fallback_journey(duration: int) -> dict:
+    return {
+        "milestones": [
+            {"week": i+1, "objective": f"Week {i+1} learning", "dependencies": [], "resources": []}
+            for i in range(duration)
+        ]
+    }
+
+async def generate_learning_journey(title: str, complexity: str, duration: int, user_id: str = None) -> dict:
+    """Generate a structured learning journey using AI. Raises if the LLM fails."""
+    result = await llm_gateway.complete(
+        [
+            {"role": "system", "content": "You are an expert learning path designer."},
+            {"role": "user", "content": journey_prompt(title, complexity, duration)}
+        ],
+        max_tokens=500,
+        temperature=0.7,
+        timeout=JOURNEY_LLM_TIMEOUT,
+        user_id=user_id
+    )
+    return parse_journey(result)
+
+def journey_cache_key(title: str, complexity: str, duration: int) -> str:
+    """Normalize so "Learn Python!" and "learn  python" share an entry."""
+    normalized_title = " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+    normalized_complexity = (complexity or "").strip().lower()
+    return f"{normalized_title}|{normalized_complexity}|{int(duration)}"
+
+class JourneyCache:
+    """
+    LRU + TTL cache of generated journeys with single-flight generation.
+
+    Concurrent misses for the same key share one in-flight LLM call. With
+    ``persist`` on, entries are also kept in the journey_cache collection
+    (expired by a TTL index) so they survive restarts.
+    """
+
+    def __init__(self, max_size: int = JOURNEY_CACHE_SIZE, ttl: int = JOURNEY_CACHE_TTL,
+                 persist: bool = JOURNEY_CACHE_PERSIST):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = OrderedDict()  # key -> (journey, llm_latency, expires_at)
+        self._in_flight = {}  # key -> Future
+        self.hits = 0
+        self.persistent_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.llm_seconds = 0.0
+        self.llm_seconds_saved = 0.0
+
+    def _get_local(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_local(self, key: str, journey: dict, latency: float, expires_at: float):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (journey, latency, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _get_persistent(self, key: str):
+        document = await get_database().journey_cache.find_one({"_id": key})
+        if document is None or document["expires_at"] <= datetime.utcnow():
+            return None
+        expires_at = time.time() + (document["expires_at"] - datetime.utcnow()).total_seconds()
+        return document["journey"], document.get("llm_latency", 0.0), expires_at
+
+    async def _put_persistent(self, key: str, journey: dict, latency: float):
+        await get_database().journey_cache.replace_one(
+            {"_id": key},
+            {"journey": journey, "llm_latency": latency,
+             "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl)},
+            upsert=True
+        )
+
+    async def get_or_generate(self, title: str, complexity: str, duration: int, user_id: str = None) -> dict:
+        """A cached journey, or one generated on behalf of `user_id` (calls joining it are not charged)."""
+        key = journey_cache_key(title, complexity, duration)
+
+        entry = self._get_local(key)
+        if entry is not None:
+            self.hits += 1
+            self.llm_seconds_saved += entry[1]
+            return copy.deepcopy(entry[0])
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(in_flight))
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            journey = await self._load(key, title, complexity, duration, user_id)
+            future.set_result(journey)
+            return copy.deepcopy(journey)
+        except asyncio.CancelledError:
+            # Waiters were not cancelled themselves, so give them a normal failure to retry on
+            future.set_exception(RuntimeError("Journey generation was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting on the shared future; mark it retrieved
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _load(self, key: str, title: str, complexity: str, duration: int, user_id: str = None) -> dict:
+        if self.persist:
+            try:
+                entry = await self._get_persistent(key)
+            except Exception as e:
+                log.error("journey_cache_lookup_failed", error=str(e))
+                entry = None
+            if entry is not None:
+                self.persistent_hits += 1
+                self.llm_seconds_saved += entry[1]
+                self._put_local(key, *entry)
+                return entry[0]
+
+        self.misses += 1
+        start = time.perf_counter()
+        journey = await generate_learning_journey(title, complexity, duration, user_id)
+        latency = time.perf_counter() - start
+        self.llm_seconds += latency
+
+        self._put_local(key, journey, latency, time.time() + self.ttl)
+        if self.persist:
+            try:
+                await self._put_persistent(key, journey, latency)
+            except Exception as e:
+                log.error("journey_cache_write_failed", error=str(e))
+        return journey
+
+    def stats(self) -> dict:
+        served = self.hits + self.persistent_hits + self.coalesced
+        lookups = served + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            "avg_llm_latency": round(self.llm_seconds / self.misses, 4) if self.misses else 0.0,
+            "llm_seconds_saved": round(self.llm_seconds_saved, 3)
+        }
+
+journey_cache = JourneyCache()
+register_stats("journey_cache", journey_cache.stats, counters=("hits", "persistent_hits", "coalesced", "misses"),
+               gauges=("size",))
+
+async def apply_journey(goal_id: str, journey: dict, source: str):
+    """Store generated milestones on a goal that is still waiting for them."""
+    db = get_database()
+    milestones = journey.get("milestones", [])
+    goal = await db.goals.find_one_and_update(
+        {"_id": ObjectId(goal_id), "status": GENERATING},
+        {"$set": {
+            "milestones": milestones,
+            "milestone_count": len(milestones),
+            "completed_count": 0,
+            "in_progress_count": 0,
+            "status": "not_started",
+            "journey_source": source
+        }, "$unset": {"journey_lease_until": ""}, "$inc": {"version": 1}},
+        projection={"user_id": 1, "title": 1, "description": 1, "category": 1}
+    )
+    if goal is not None:
+        await goal_cache.invalidate(goal["user_id"])
+        goal_search.index_goal({**goal, "milestones": milestones})
+        await record_goal_change(
+            db, goal["user_id"],
+            before={"status": GENERATING, "progress": 0, "completed_count": 0},
+            after={"status": "not_started", "progress": 0, "completed_count": 0}
+        )
+
+class JourneyWorkerPool:
+    """Bounded queue of journey jobs served by a fixed number of async workers."""
+
+    def __init__(self, workers: int = JOURNEY_WORKERS, queue_size: int = JOURNEY_QUEUE_SIZE,
+                 max_attempts: int = JOURNEY_MAX_ATTEMPTS, retry_delay: float = JOURNEY_RETRY_DELAY,
+                 max_finished_jobs: int = 1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = OrderedDict()  # goal_id -> job status
+        self._queue = None
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Let queued jobs finish for up to `timeout` seconds, then cancel the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("journey_pool_stopped_with_queue", queued=self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Hand unfinished goals back so the next process to start recovers them right away
+        unfinished = [ObjectId(goal_id) for goal_id, job in self.jobs.items() if "finished_at" not in job]
+        if unfinished:
+            try:
+                await get_database().goals.update_many(
+                    {"_id": {"$in": unfinished}, "status": GENERATING}, {"$unset": {"journey_lease_until": ""}}
+                )
+            except Exception as e:
+                log.warning("journey_lease_release_failed", goals=len(unfinished), error=str(e))
+
+    def submit(self, goal_id: str, title: str, complexity: str, duration: int, user_id: str = None) -> bool:
+        """
+        Queue a job. The goal owner's `user_id` goes with its LLM call, so the
+        gateway's per-user limits apply. Returns False when the pool is not
+        running or the queue is full.
+        """
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait((goal_id, title, complexity, duration, user_id))
+        except asyncio.QueueFull:
+            return False
+        self.jobs[goal_id] = {"status": "queued", "attempts": 0, "error": None, "submitted_at": time.time()}
+        return True
+
+    def job(self, goal_id: str):
+        return self.jobs.get(goal_id)
+
+    def _finish(self, goal_id: str, status: str):
+        job = self.jobs.get(goal_id)
+        if job is not None:
+            job.update(status=status, finished_at=time.time())
+            self.jobs.move_to_end(goal_id)
+        finished = [key for key, value in self.jobs.items() if "finished_at" in value]
+        for key in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[key]
+
+    async def _worker(self):
+        while True:
+            goal_id, title, complexity, duration, user_id = await self._queue.get()
+            try:
+                await self._process(goal_id, title, complexity, duration, user_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("journey_job_failed", goal_id=goal_id, error=str(e))
+                self._finish(goal_id, "failed")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, goal_id: str, title: str, complexity: str, duration: int, user_id: str = None):
+        job = self.jobs.setdefault(goal_id, {"status": "queued", "attempts": 0, "error": None})
+        job["status"] = "running"
+
+        for attempt in range(1, self.max_attempts + 1):
+            job["attempts"] = attempt
+            try:
+                journey = await journey_cache.get_or_generate(title, complexity, duration, user_id)
+                await apply_journey(goal_id, journey, "llm")
+                self._finish(goal_id, "ready")
+                return
+            except Exception as e:
+                job["error"] = str(e)
+                if attempt < self.max_attempts:
+                    delay = self.retry_delay * (2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+        log.warning("journey_fallback", goal_id=goal_id, attempts=job["attempts"], error=job["error"])
+        await apply_journey(goal_id, fallback_journey(duration), "fallback")
+        self._finish(goal_id, "fallback")
+
+    async def recover(self, limit: int = 1000) -> int:
+        """
+        Re-queue goals left in "generating" by a previous process. Each goal
+        is claimed by taking its lease first, so when several workers start
+        together every goal is queued by exactly one of them.
+        """
+        db = get_database()
+        recovered = 0
+        while recovered < limit and self.running and self.queued < self.queue_size:
+            # A goal without a lease predates leases or was released on shutdown
+            goal = await db.goals.find_one_and_update(
+                {"status": GENERATING, "journey_lease_until": {"$not": {"$gt": datetime.now()}}},
+                {"$set": {"journey_lease_until": journey_lease()}},
+                projection={"title": 1, "complexity": 1, "duration": 1, "user_id": 1}
+            )
+            if goal is None:
+                break
+            goal_id = str(goal["_id"])
+            if goal_id in self.jobs:
+                continue
+            if not self.submit(goal_id, goal.get("title", ""), goal.get("complexity", "intermediate"),
+                               goal.get("duration", 12), goal.get("user_id")):
+                await db.goals.update_one({"_id": goal["_id"]}, {"$unset": {"journey_lease_until": ""}})
+                break
+            recovered += 1
+        return recovered
+
+journey_pool = JourneyWorkerPool()
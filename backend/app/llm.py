@@ -0,0 +1,478 @@
+"""
+LLM gateway and pluggable providers.
+
+Everything that needs a completion goes through ``llm_gateway``, which owns
+the provider (and with it the pooled AsyncOpenAI client) and enforces:
+
+- a global and a per-user concurrency limit,
+- a deadline per call, covering the wait for a slot,
+- jittered exponential retry on 429/5xx and connection errors,
+- latency, token and error accounting (see ``stats()``).
+
+Failures surface as LLMError subclasses instead of one catch-all message.
+LLM_PROVIDER=fake swaps in FakeLLMProvider, an in-process stand-in with
+configurable latency and failure rate, so the app and benchmarks run offline.
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from collections import deque
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from app.log import get_logger
+from app.metrics import registry, LLM_LATENCY
+
+log = get_logger("app.llm")
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" or "fake"
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", "2"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds per call, including retries
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_DELAY = float(os.getenv("LLM_RETRY_DELAY", "0.5"))  # seconds, doubled per retry
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))  # seconds
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+LLM_READY_TIMEOUT = float(os.getenv("LLM_READY_TIMEOUT", "3"))  # seconds per readiness probe
+LLM_READY_TTL = float(os.getenv("LLM_READY_TTL", "30"))  # seconds a probe result is reused
+
+class LLMError(Exception):
+    """Base class for failures reported by the gateway."""
+
+class LLMNotConfigured(LLMError):
+    pass
+
+class LLMTimeout(LLMError):
+    pass
+
+class LLMRateLimited(LLMError):
+    pass
+
+class LLMQuotaExceeded(LLMError):
+    pass
+
+class LLMUnavailable(LLMError):
+    pass
+
+class LLMProvider:
+    name = "base"
+
+    async def complete(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None) -> str:
+        """Return the completion text, filling `usage` with token counts when given."""
+        raise NotImplementedError
+
+    async def ping(self):
+        """Raise if the provider can't be reached. Must not spend tokens."""
+
+    async def stream(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None):
+        """Yield the completion in pieces. Providers without streaming yield it whole."""
+        yield await self.complete(messages, max_tokens, temperature, usage)
+
+def _record_usage(usage: dict, source):
+    if usage is not None and source is not None:
+        usage["prompt_tokens"] = getattr(source, "prompt_tokens", 0) or 0
+        usage["completion_tokens"] = getattr(source, "completion_tokens", 0) or 0
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = LLM_MODEL, max_connections: int = LLM_MAX_CONCURRENCY):
+        # One pooled client for the process; the gateway does retries and deadlines
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        )
+        self.model = model
+
+    async def complete(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        _record_usage(usage, response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def stream(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in response:
+                if chunk.usage is not None:
+                    _record_usage(usage, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Frees the upstream connection when the consumer stops early
+            await response.close()
+
+    async def ping(self):
+        # Model metadata lookup: proves the key and network work without a completion
+        await self.client.models.retrieve(self.model, timeout=LLM_READY_TIMEOUT)
+
+    async def close(self):
+        await self.client.close()
+
+class FakeLLMError(Exception):
+    status_code = 503
+
+def fake_response(messages: list) -> str:
+    """Canned answers: a valid milestones document for journey prompts, an echo otherwise."""
+    prompt = messages[-1]["content"] if messages else ""
+    weeks = re.search(r"Duration:\s*(\d+)\s*weeks", prompt)
+    if weeks:
+        topic = re.search(r"learning journey for:\s*(.+)", prompt)
+        topic = topic.group(1).strip() if topic else "the topic"
+        return json.dumps({"milestones": [
+            {"week": i + 1, "objective": f"{topic}: part {i + 1}", "dependencies": [], "resources": []}
+            for i in range(int(weeks.group(1)))
+        ]})
+    return f"(fake tutor) You asked: {prompt[-200:]}"
+
+class FakeLLMProvider(LLMProvider):
+    """In-process stand-in with configurable latency and failure rate (failures look like a 503)."""
+    name = "fake"
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 responder=fake_response):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.responder = responder
+        self.calls = 0
+
+    def _usage(self, usage: dict, messages: list, text: str):
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(m["content"].split()) for m in messages)
+            usage["completion_tokens"] = len(text.split())
+
+    async def complete(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeLLMError("Injected fake LLM failure")
+        text = self.responder(messages)
+        self._usage(usage, messages, text)
+        return text
+
+    async def stream(self, messages: list, max_tokens: int, temperature: float = 0.7, usage: dict = None):
+        """Yield the canned answer word by word, spreading `latency` across the words."""
+        self.calls += 1
+        if self.failure_rate and random.random() < self.failure_rate:
+            await asyncio.sleep(self.latency)
+            raise FakeLLMError("Injected fake LLM failure")
+        text = self.responder(messages)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+        self._usage(usage, messages, text)
+
+_provider = None
+
+def create_provider():
+    if LLM_PROVIDER == "fake":
+        return FakeLLMProvider()
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    return OpenAIProvider(api_key)
+
+def get_provider():
+    """Return the configured provider, or None when no LLM is available."""
+    global _provider
+    if _provider is None:
+        _provider = create_provider()
+    return _provider
+
+def set_provider(provider):
+    global _provider
+    _provider = provider
+
+def classify_error(error: Exception):
+    """Map a provider exception to (LLMError subclass, retryable)."""
+    if isinstance(error, LLMError):
+        return type(error), False
+    if isinstance(error, openai.RateLimitError):
+        if getattr(error, "code", None) == "insufficient_quota":
+            return LLMQuotaExceeded, False
+        return LLMRateLimited, True
+    if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return LLMTimeout, True
+    if isinstance(error, openai.APIConnectionError):
+        return LLMUnavailable, True
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return LLMRateLimited, True
+    if isinstance(status_code, int) and status_code >= 500:
+        return LLMUnavailable, True
+    return LLMError, False
+
+class LLMGateway:
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_concurrency_per_user: int = LLM_MAX_CONCURRENCY_PER_USER,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 retry_delay: float = LLM_RETRY_DELAY):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_user = max_concurrency_per_user
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_user = {}  # user_id -> [semaphore, holders]; dropped when unused
+        self.in_flight = 0
+        self.waiting = 0  # calls queued for a concurrency slot
+        self.calls = 0
+        self.retries = 0
+        self.errors = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._latencies = deque(maxlen=1000)
+        self._last_probe = None  # (monotonic time, result)
+
+    @property
+    def provider(self):
+        return get_provider()
+
+    @property
+    def available(self) -> bool:
+        return self.provider is not None
+
+    async def _acquire(self, user_id):
+        entry = None
+        if user_id is not None:
+            entry = self._per_user.get(user_id)
+            if entry is None:
+                entry = self._per_user[user_id] = [asyncio.Semaphore(self.max_concurrency_per_user), 0]
+            entry[1] += 1
+            try:
+                await entry[0].acquire()
+            except BaseException:
+                self._release_user(user_id, entry, acquired=False)
+                raise
+        try:
+            await self._global.acquire()
+        except BaseException:
+            if entry is not None:
+                self._release_user(user_id, entry, acquired=True)
+            raise
+        return entry
+
+    def user_pending(self, user_id) -> int:
+        """Calls the user has in flight or waiting for a slot."""
+        entry = self._per_user.get(user_id)
+        return entry[1] if entry is not None else 0
+
+    def _release_user(self, user_id, entry, acquired: bool = True):
+        if acquired:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._per_user[user_id]
+
+    def _release(self, user_id, entry):
+        self._global.release()
+        if entry is not None:
+            self._release_user(user_id, entry)
+
+    def _record(self, started: float, usage: dict, error_kind=None):
+        elapsed = time.perf_counter() - started
+        self._latencies.append(elapsed)
+        provider = self.provider
+        LLM_LATENCY.observe(elapsed, provider.name if provider else "none",
+                            error_kind.__name__ if error_kind is not None else "ok")
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        if error_kind is not None:
+            self.errors[error_kind.__name__] = self.errors.get(error_kind.__name__, 0) + 1
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def complete(self, messages: list, max_tokens: int, temperature: float = 0.7,
+                       user_id: str = None, timeout: float = None) -> str:
+        provider = self.provider
+        if provider is None:
+            raise LLMNotConfigured("No LLM provider configured")
+        try:
+            return await asyncio.wait_for(
+                self._complete(provider, messages, max_tokens, temperature, user_id),
+                timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.errors["LLMTimeout"] = self.errors.get("LLMTimeout", 0) + 1
+            raise LLMTimeout(f"LLM call exceeded {timeout or self.timeout}s")
+
+    async def _complete(self, provider, messages, max_tokens, temperature, user_id) -> str:
+        self.waiting += 1
+        try:
+            entry = await self._acquire(user_id)
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.calls += 1
+                usage = {}
+                started = time.perf_counter()
+                try:
+                    text = await provider.complete(messages, max_tokens, temperature, usage)
+                    self._record(started, usage)
+                    return text
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    kind, retryable = classify_error(e)
+                    self._record(started, usage, kind)
+                    if not retryable or attempt == self.max_retries:
+                        raise kind(str(e)) from e
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt))
+        finally:
+            self.in_flight -= 1
+            self._release(user_id, entry)
+
+    async def stream(self, messages: list, max_tokens: int, temperature: float = 0.7,
+                     user_id: str = None, timeout: float = None):
+        """
+        Yield completion deltas. Retries only happen before the first delta;
+        the deadline covers the whole stream.
+        """
+        provider = self.provider
+        if provider is None:
+            raise LLMNotConfigured("No LLM provider configured")
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        def remaining() -> float:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise LLMTimeout(f"LLM stream exceeded {timeout or self.timeout}s")
+            return left
+
+        self.waiting += 1
+        try:
+            entry = await asyncio.wait_for(self._acquire(user_id), remaining())
+        except asyncio.TimeoutError:
+            raise LLMTimeout("Timed out waiting for an LLM slot")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.calls += 1
+                usage = {}
+                started = time.perf_counter()
+                yielded = False
+                deltas = provider.stream(messages, max_tokens, temperature, usage)
+                try:
+                    while True:
+                        try:
+                            delta = await asyncio.wait_for(deltas.__anext__(), remaining())
+                        except StopAsyncIteration:
+                            break
+                        yielded = True
+                        yield delta
+                    self._record(started, usage)
+                    return
+                except (asyncio.CancelledError, GeneratorExit):
+                    raise
+                except Exception as e:
+                    kind, retryable = classify_error(e)
+                    self._record(started, usage, kind)
+                    if yielded or not retryable or attempt == self.max_retries:
+                        raise kind(str(e)) from e
+                    self.retries += 1
+                    await asyncio.sleep(min(self._backoff(attempt), remaining()))
+                finally:
+                    await deltas.aclose()
+        finally:
+            self.in_flight -= 1
+            self._release(user_id, entry)
+
+    def _percentile(self, ordered: list, pct: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def stats(self) -> dict:
+        ordered = sorted(self._latencies)
+        return {
+            "provider": self.provider.name if self.provider else None,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "active_users": len(self._per_user),
+            "calls": self.calls,
+            "retries": self.retries,
+            "errors": dict(self.errors),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50": round(self._percentile(ordered, 50), 4),
+            "latency_p95": round(self._percentile(ordered, 95), 4),
+            "latency_p99": round(self._percentile(ordered, 99), 4)
+        }
+
+    def start(self):
+        """Create the provider (and its HTTP client) up front instead of on the first call."""
+        provider = get_provider()
+        log.info("llm_provider_ready", provider=provider.name if provider else None)
+
+    async def ready(self) -> dict:
+        """
+        Probe the provider, reusing the last answer for LLM_READY_TTL seconds
+        so load-balancer probes don't turn into a steady stream of API calls.
+        """
+        now = time.monotonic()
+        if self._last_probe is not None and now - self._last_probe[0] < LLM_READY_TTL:
+            return self._last_probe[1]
+
+        provider = self.provider
+        if provider is None:
+            result = {"ok": False, "provider": None, "error": "not configured"}
+        else:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(provider.ping(), LLM_READY_TIMEOUT)
+                result = {"ok": True, "provider": provider.name,
+                          "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+            except Exception as e:
+                error_type, _ = classify_error(e)
+                result = {"ok": False, "provider": provider.name, "error": f"{error_type.__name__}: {e}"}
+        self._last_probe = (now, result)
+        return result
+
+    async def close(self):
+        provider = get_provider()
+        if provider is not None and hasattr(provider, "close"):
+            await provider.close()
+
+llm_gateway = LLMGateway()
+
+@registry.collector
+def _llm_metrics():
+    return [
+        ("llm_calls_total", "counter", "LLM provider attempts", [({}, llm_gateway.calls)]),
+        ("llm_retries_total", "counter", "LLM attempts retried", [({}, llm_gateway.retries)]),
+        ("llm_errors_total", "counter", "LLM failures by error type",
+         [({"type": kind}, count) for kind, count in llm_gateway.errors.items()]),
+        ("llm_tokens_total", "counter", "LLM tokens used",
+         [({"kind": "prompt"}, llm_gateway.prompt_tokens), ({"kind": "completion"}, llm_gateway.completion_tokens)]),
+        ("llm_in_flight", "gauge", "LLM calls holding a slot", [({}, llm_gateway.in_flight)]),
+        ("llm_waiting", "gauge", "LLM calls waiting for a slot", [({}, llm_gateway.waiting)]),
+    ]
@@ -0,0 +1,84 @@
+"""
+Structured, level-controlled logging.
+
+    log = get_logger(__name__)
+    log.info("journey_failed", goal_id=goal_id, error=str(e))
+    log.debug("tutor_message", sample=True, user_id=user_id)
+
+Each call is one event name plus key/value fields, written as JSON lines
+(LOG_FORMAT=json) or "event key=value" text. Calls below LOG_LEVEL return
+before any formatting work. Events logged with sample=True are high-volume
+(one per WebSocket message, per request...) and only LOG_SAMPLE_RATE of
+them are kept.
+"""
+import os
+import sys
+import json
+import random
+import logging
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+def configure(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Send the app's loggers to stderr. Library and uvicorn loggers are left alone."""
+    logger = logging.getLogger("app")
+    logger.handlers.clear()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+class EventLogger:
+    __slots__ = ("_logger",)
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def _log(self, level: int, event: str, sample: bool, exc_info, fields: dict):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample and random.random() >= LOG_SAMPLE_RATE:
+            return
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event: str, sample: bool = False, **fields):
+        self._log(logging.DEBUG, event, sample, None, fields)
+
+    def info(self, event: str, sample: bool = False, **fields):
+        self._log(logging.INFO, event, sample, None, fields)
+
+    def warning(self, event: str, sample: bool = False, **fields):
+        self._log(logging.WARNING, event, sample, None, fields)
+
+    def error(self, event: str, sample: bool = False, exc_info=None, **fields):
+        self._log(logging.ERROR, event, sample, exc_info, fields)
+
+def get_logger(name: str) -> EventLogger:
+    return EventLogger(name)
+
+configure()
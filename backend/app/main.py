@@ -1,17 +1,88 @@
+import time
+PROCESS_START = time.perf_counter()
+
 # Load environment variables FIRST
 from dotenv import load_dotenv
 load_dotenv()
 
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
-from openai import AsyncOpenAI
-import json
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from .routes import auth_router, goals_router, checkins_router, progress_router
+from .auth import password_executor
+from . import database
+from .indexes import INDEX_BOOTSTRAP, ensure_indexes
+from .journeys import journey_pool
+from .checkins import checkin_writer
+from .tutor import tutor_manager
+from .answer_cache import answer_cache
+from .conversations import conversation_store
+from .llm import llm_gateway
+from .admission import admission
+from .log import get_logger
+from .metrics import registry, MetricsMiddleware
+
+log = get_logger("app.main")
+
+# With 0, /api/ready only reports the LLM and keeps the worker in rotation while it is down
+READY_REQUIRE_LLM = os.getenv("READY_REQUIRE_LLM", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    started = time.perf_counter()
+    timings = {"import": (started - PROCESS_START) * 1000}
+
+    def lap(name: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[name] = (now - since) * 1000
+        return now
+
+    db = database.connect()
+    mongo = await database.ping(timeout=database.MONGO_SERVER_SELECTION_TIMEOUT_MS / 1000)
+    if mongo["ok"]:
+        log.info("mongo_connected", latency_ms=mongo["latency_ms"])
+    else:
+        log.error("mongo_unreachable", error=mongo["error"])
+    step = lap("mongo", started)
+
+    if INDEX_BOOTSTRAP and mongo["ok"]:
+        try:
+            await ensure_indexes(db)
+        except Exception as e:
+            log.error("index_bootstrap_failed", error=str(e))
+        step = lap("indexes", step)
 
+    llm_gateway.start()
+    step = lap("llm", step)
 
-app = FastAPI()
+    await journey_pool.start()
+    await checkin_writer.start()
+    await tutor_manager.start()
+    try:
+        recovered = await journey_pool.recover()
+        if recovered:
+            log.info("journeys_recovered", count=recovered)
+    except Exception as e:
+        log.error("journey_recovery_failed", error=str(e))
+    lap("workers", step)
+
+    app.state.ready = True
+    total = (time.perf_counter() - PROCESS_START) * 1000
+    log.info("cold_start", total_ms=round(total), **{f"{name}_ms": round(ms) for name, ms in timings.items()})
+    yield
+    app.state.ready = False
+    await tutor_manager.drain()
+    await journey_pool.stop()
+    await checkin_writer.stop()
+    await llm_gateway.close()
+    password_executor.shutdown()
+    database.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth_router, prefix="/api/auth", tags=["auth"])
 app.include_router(goals_router, prefix="/api/goals", tags=["goals"])
@@ -42,78 +113,12 @@ async def options_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
-# Initialize OpenAI client
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if openai_api_key:
-    print(f"OpenAI API Key: {openai_api_key[:15]}...")
-    client = AsyncOpenAI(api_key=openai_api_key)
-else:
-    client = None
-    print("❌ OPENAI_API_KEY not found")
-
-# Import and include routes
-try:
-    from app.routes import auth, goals, progress, checkins
-    app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
-    app.include_router(goals.router, prefix="/api/goals", tags=["goals"]) 
-    app.include_router(progress.router, prefix="/api/progress", tags=["progress"])
-    app.include_router(checkins.router, prefix="/api/checkins", tags=["checkins"])
-    print("✅ All routes loaded successfully")
-except ImportError as e:
-    print(f"❌ Failed to import routes: {e}")
+# Added last so it wraps every other middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 @app.websocket("/ws/tutor/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await websocket.accept()
-    print(f"✅ User {user_id} connected to AI Tutor")
-    
-    try:
-        while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-            
-            print(f"📨 Received: {message_data}")
-            
-            if message_data.get("type") == "user_message":
-                user_message = message_data.get("message", "")
-                context = message_data.get("context", "learning")
-                
-                ai_response = await generate_ai_response(user_message, context)
-                
-                response_data = {
-                    "type": "ai_response",
-                    "message": ai_response,
-                    "timestamp": message_data.get("timestamp")
-                }
-                
-                await websocket.send_text(json.dumps(response_data))
-                print(f"📤 Sent: {ai_response}")
-    
-    except WebSocketDisconnect:
-        print(f"❌ User {user_id} disconnected")
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        await websocket.close(code=1011)
-
-async def generate_ai_response(user_message: str, context: str) -> str:
-    if client is None:
-        return "I'm here to help with your learning goals!"
-    
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful AI tutor."},
-                {"role": "user", "content": f"Context: {context}\nQuestion: {user_message}"}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
-    
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
-        return "You exceeded your current quota!"
+    await tutor_manager.serve(websocket, user_id)
 
 @app.get("/")
 async def root():
@@ -121,4 +126,41 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    """Liveness: the process is up and serving requests."""
+    return {"status": "healthy"}
+
+@app.get("/api/ready")
+async def readiness_check():
+    """Readiness: started, not draining, MongoDB answers a ping and the LLM provider is reachable."""
+    mongo, llm = await asyncio.gather(database.ping(), llm_gateway.ready())
+    started = getattr(app.state, "ready", False) and not tutor_manager.draining
+    ready = started and mongo["ok"] and (llm["ok"] or not READY_REQUIRE_LLM)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "started": started, "mongodb": mongo, "llm": llm}
+    )
+
+@app.get("/api/tutor/stats")
+async def tutor_stats():
+    return tutor_manager.stats()
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/tutor/cache")
+async def tutor_cache_stats():
+    return answer_cache.stats()
+
+@app.get("/api/tutor/history")
+async def tutor_history_stats():
+    return conversation_store.stats()
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return llm_gateway.stats()
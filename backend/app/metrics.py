@@ -0,0 +1,188 @@
+"""
+Prometheus metrics.
+
+A small registry of counters and histograms rendered in the Prometheus text
+format by GET /metrics. Sources:
+
+- MetricsMiddleware: request count and latency per method, route template
+  and status,
+- MongoCommandListener: duration and failures per MongoDB command, as
+  reported by the driver,
+- the LLM gateway: call latency, plus collectors that read its counters,
+- collectors registered by other components (tutor sessions, caches,
+  queues) that are read at scrape time.
+
+Metrics are updated from the event loop and from the driver's threads, so
+every update takes a short lock.
+"""
+import time
+import threading
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(entry)) for labels, entry in self._values.items()]
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {entry[-1]}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {entry[-2]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {entry[-1]}"
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """
+        Register fn() returning [(name, kind, help, [(labels_dict, value), ...]), ...],
+        read at scrape time. Usable as a decorator.
+        """
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self.collectors:
+            for name, kind, help, values in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests served", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+MONGO_LATENCY = registry.histogram("mongo_command_duration_seconds", "MongoDB command latency", ("command",))
+MONGO_FAILURES = registry.counter("mongo_command_failures_total", "MongoDB commands that failed", ("command",))
+LLM_LATENCY = registry.histogram("llm_request_duration_seconds", "LLM call latency including retries and queueing",
+                                 ("provider", "outcome"), buckets=LLM_BUCKETS)
+
+def register_stats(prefix: str, stats, counters=(), gauges=()):
+    """Expose numeric fields of a component's stats() dict, read at scrape time."""
+    def collect():
+        values = stats()
+        return [
+            (f"{prefix}_{key}_total", "counter", f"{prefix} {key.replace('_', ' ')}", [({}, values[key])])
+            for key in counters
+        ] + [
+            (f"{prefix}_{key}", "gauge", f"{prefix} {key.replace('_', ' ')}", [({}, values[key])])
+            for key in gauges
+        ]
+    registry.collector(collect)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing each HTTP request until its last body chunk is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The route template keeps label cardinality bounded (no raw ids in paths)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - start, method, route)
+            HTTP_REQUESTS.inc(1, method, route, str(status[0]))
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, event.command_name)
+        MONGO_FAILURES.inc(1, event.command_name)
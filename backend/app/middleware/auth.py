@@ -1,16 +1,114 @@
+import os
+import time
+from collections import OrderedDict
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from app.auth import SECRET_KEY, ALGORITHM
+from app.auth import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.metrics import register_stats
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))  # seconds
 
 security = HTTPBearer()
 
+class TokenCache:
+    """
+    Bounded LRU cache of verified token -> user_id.
+
+    Entries live for at most ``ttl`` seconds and never past the token's own
+    ``exp``. Revoked tokens are evicted from the cache and remembered until
+    they would have expired anyway. The cache is per process, so a
+    revocation only applies to the worker that handled it.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (user_id, expires_at)
+        self._revoked = {}  # token -> exp
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user_id
+
+    def put(self, token: str, user_id: str, exp=None):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+
+        self._entries[token] = (user_id, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def revoke(self, token: str, exp=None):
+        self._entries.pop(token, None)
+        now = time.time()
+        if exp is None:
+            exp = now + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        # Expired tokens fail signature checks on their own, so drop them
+        self._revoked = {t: e for t, e in self._revoked.items() if e > now}
+        self._revoked[token] = float(exp)
+
+    def is_revoked(self, token: str) -> bool:
+        return token in self._revoked
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "revoked": len(self._revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+token_cache = TokenCache()
+register_stats("token_cache", token_cache.stats, counters=("hits", "misses"))
+
+def invalid_token():
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return verify_token(credentials.credentials)
+
+def verify_token(token: str) -> str:
+    """The user id a bearer token was issued to; raises 401 for a bad, expired or revoked token."""
+    # Fast path: token already verified recently
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    if token_cache.is_revoked(token):
+        raise invalid_token()
+
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+            raise invalid_token()
+        token_cache.put(token, user_id, payload.get("exp"))
         return user_id
     except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        raise invalid_token()
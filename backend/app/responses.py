@@ -0,0 +1,26 @@
+"""
+Response classes that skip FastAPI's jsonable_encoder.
+
+Returning a Response from a route bypasses FastAPI's own encoding, so these
+are only worth using where the body is large or built in a hot loop.
+"""
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+def orjson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Bytes are sent as they are, so bodies
+    already produced by a pydantic TypeAdapter's dump_json() pass straight
+    through.
+    """
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
@@ -1,15 +1,29 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from pymongo.errors import DuplicateKeyError
 from app.database import get_database
-from app.auth import get_password_hash, verify_password, create_access_token
+from app.middleware.auth import security, get_current_user, token_cache
+from app.auth import hash_password, check_password, create_access_token, PasswordPoolSaturated
 from datetime import datetime
-import traceback
 from fastapi.responses import JSONResponse
+from app.log import get_logger
+
+log = get_logger("app.routes.auth")
 
 router = APIRouter()
 
+def password_pool_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy. Please try again shortly.",
+        headers={"Retry-After": "1"}
+    )
+
 # Explicit OPTIONS handlers for auth endpoints
 @router.api_route("/login", methods=["OPTIONS"])
 @router.api_route("/register", methods=["OPTIONS"])
+@router.api_route("/logout", methods=["OPTIONS"])
 async def auth_options():
     response = JSONResponse(content={"message": "OK"})
     response.headers["Access-Control-Allow-Origin"] = "http://localhost:5173"  # Changed to 5173
@@ -32,7 +46,7 @@ async def register(user_data: dict):
             )
         
         # Create user
-        hashed_password = get_password_hash(user_data.get("password", ""))
+        hashed_password = await hash_password(user_data.get("password", ""))
         user = {
             "name": user_data.get("name", ""),
             "email": user_data.get("email", ""),
@@ -41,7 +55,14 @@ async def register(user_data: dict):
             "created_at": datetime.now()
         }
         
-        result = await db.users.insert_one(user)
+        try:
+            result = await db.users.insert_one(user)
+        except DuplicateKeyError:
+            # Lost a race with a concurrent registration for the same email
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
         
         # Create token
         access_token = create_access_token({"sub": str(result.inserted_id)})
@@ -58,9 +79,10 @@ async def register(user_data: dict):
         }
     except HTTPException:
         raise
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
     except Exception as e:
-        print(f"Registration error: {e}")
-        print(traceback.format_exc())
+        log.error("registration_failed", exc_info=True, error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Registration failed. Please try again."
@@ -72,7 +94,7 @@ async def login(credentials: dict):
         db = get_database()
         
         user = await db.users.find_one({"email": credentials.get("email")})
-        if not user or not verify_password(credentials.get("password", ""), user["hashed_password"]):
+        if not user or not await check_password(credentials.get("password", ""), user["hashed_password"]):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
@@ -92,10 +114,25 @@ async def login(credentials: dict):
         }
     except HTTPException:
         raise
+    except PasswordPoolSaturated:
+        raise password_pool_busy()
     except Exception as e:
-        print(f"Login error: {e}")
-        print(traceback.format_exc())
+        log.error("login_failed", exc_info=True, error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Login failed. Please try again."
-        )
\ No newline at end of file
+        )
+
+@router.post("/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user_id: str = Depends(get_current_user)
+):
+    # Token is already verified by get_current_user, so the claims can be trusted
+    claims = jwt.get_unverified_claims(credentials.credentials)
+    token_cache.revoke(credentials.credentials, claims.get("exp"))
+    return {"message": "Logged out successfully"}
+
+@router.get("/token-cache")
+async def get_token_cache_stats(user_id: str = Depends(get_current_user)):
+    return token_cache.stats()
@@ -1,23 +1,83 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Response, Query
+from bson import ObjectId
+from typing import Literal, Optional
 from app.database import get_database
 from app.middleware.auth import get_current_user
+from app.schemas.checkin import BulkCheckinRequest
+from app.checkins import checkin_writer, CHECKIN_ACK
 from datetime import datetime
 
 router = APIRouter()
 
-@router.post("")
-async def create_checkin(checkin_data: dict, user_id: str = Depends(get_current_user)):
-    db = get_database()
-    
-    checkin = {
+AckMode = Optional[Literal["durable", "buffered"]]
+
+async def owned_goal_ids(db, user_id: str, goal_ids) -> set:
+    """The subset of goal_ids that are valid and belong to the user, in one projected read."""
+    valid = {ObjectId(goal_id) for goal_id in goal_ids if isinstance(goal_id, str) and ObjectId.is_valid(goal_id)}
+    if not valid:
+        return set()
+    cursor = db.goals.find({"_id": {"$in": list(valid)}, "user_id": user_id}, {"_id": 1})
+    return {str(goal["_id"]) async for goal in cursor}
+
+def checkin_document(checkin_data: dict, user_id: str, checkin_date: datetime) -> dict:
+    return {
         "user_id": user_id,
         "goal_id": checkin_data.get("goal_id"),
         "progress_notes": checkin_data.get("progress_notes", ""),
         "completed_milestones": checkin_data.get("completed_milestones", []),
         "challenges": checkin_data.get("challenges", ""),
         "next_steps": checkin_data.get("next_steps", ""),
-        "checkin_date": datetime.now()
+        "checkin_date": checkin_date
+    }
+
+@router.post("")
+async def create_checkin(checkin_data: dict, response: Response, ack: AckMode = Query(None),
+                         user_id: str = Depends(get_current_user)):
+    db = get_database()
+
+    goal_id = checkin_data.get("goal_id")
+    if not await owned_goal_ids(db, user_id, [goal_id]):
+        raise HTTPException(status_code=404, detail="Goal not found")
+
+    checkin = checkin_document(checkin_data, user_id, datetime.now())
+    if not await checkin_writer.write([checkin], durable=(ack or CHECKIN_ACK) == "durable"):
+        response.status_code = 202
+        return {"message": "Check-in accepted", "status": "queued"}
+    return {"message": "Check-in recorded successfully", "status": "stored"}
+
+@router.post("/bulk")
+async def create_checkins(batch: BulkCheckinRequest, response: Response, ack: AckMode = Query(None),
+                          user_id: str = Depends(get_current_user)):
+    """
+    Record many check-ins at once. Goal ownership is checked with a single
+    read; check-ins for unknown goals are reported as failed and the rest
+    are written together.
+    """
+    db = get_database()
+    owned = await owned_goal_ids(db, user_id, {c.goal_id for c in batch.checkins})
+
+    now = datetime.now()
+    results, checkins = [], []
+    for i, item in enumerate(batch.checkins):
+        if item.goal_id in owned:
+            checkins.append(checkin_document(item.dict(), user_id, now))
+            results.append({"index": i, "status": "accepted", "error": None})
+        else:
+            results.append({"index": i, "status": "failed", "error": "Goal not found"})
+
+    stored = True
+    if checkins:
+        stored = await checkin_writer.write(checkins, durable=(ack or CHECKIN_ACK) == "durable")
+        if not stored:
+            response.status_code = 202
+
+    return {
+        "results": results,
+        "accepted": len(checkins),
+        "failed": len(results) - len(checkins),
+        "status": "stored" if stored else "queued"
     }
-    
-    result = await db.checkins.insert_one(checkin)
-    return {"message": "Check-in recorded successfully"}
\ No newline at end of file
+
+@router.get("/writer")
+async def get_checkin_writer_stats(user_id: str = Depends(get_current_user)):
+    return checkin_writer.stats()
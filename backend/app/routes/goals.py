@@ -1,14 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Response, status
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
-from typing import List
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Literal, Optional
 from datetime import datetime
+import base64
 from app.middleware.auth import get_current_user
-from app.schemas.goal import GoalUpdate
+from app.admission import admitted_user
+from app.schemas.goal import (
+    GoalUpdate, BatchRequest, GoalEnvelope, GoalPage, GoalSearchPage, MilestoneRange, GOAL_FIELDS, goal_adapter,
+    goal_envelope_adapter, goal_page_adapter, goal_search_page_adapter, milestone_range_adapter
+)
+from app.responses import FastJSONResponse
 from app.database import get_database
+from app.journeys import journey_pool, journey_cache, apply_journey, fallback_journey, journey_lease, GENERATING
+from app.user_stats import record_goal_change, record_goal_changes
+from app.goal_cache import goal_cache
+from app.search import goal_search
 import json
+import math
 
 router = APIRouter()
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+DEFAULT_SEARCH_SIZE = 20
+MAX_SEARCH_SIZE = 100
+MAX_SEARCH_OFFSET = 1000
+STREAM_BATCH_SIZE = 100
+
+# Newest first; _id breaks ties between goals created in the same millisecond
+GOALS_SORT = [("created_at", -1), ("_id", -1)]
+
+MILESTONE_STATUSES = ("not_started", "in_progress", "completed")
+
+MAX_WEEK = 52
+
 def goal_helper(goal) -> dict:
     return {
         "id": goal["_id"],
@@ -25,105 +53,491 @@ def goal_helper(goal) -> dict:
         "created_at": goal["created_at"]
     }
 
-async def generate_learning_journey(title: str, complexity: str, duration: int):
-    """Generate a structured learning journey using AI"""
+def encode_cursor(goal) -> str:
+    raw = json.dumps({"c": goal["created_at"].isoformat(), "i": str(goal["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn an `after` cursor into a keyset filter on (created_at, _id)."""
     try:
-        from app.main import clients
-        
-        prompt = f"""
-        Create a {complexity} level learning journey for: {title}
-        Duration: {duration} weeks
-        Break it into weekly milestones with specific learning objectives.
-        Return ONLY valid JSON format with this structure:
-        {{
-            "milestones": [
-                {{
-                    "week": 1,
-                    "objective": "specific learning objective",
-                    "dependencies": [],
-                    "resources": ["resource1", "resource2"]
-                }}
-            ]
-        }}
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert learning path designer."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        result = response.choices[0].message.content.strip()
-        json_start = result.find('{')
-        json_end = result.rfind('}') + 1
-        json_str = result[json_start:json_end]
-        
-        return json.loads(json_str)
-        
-    except Exception as e:
-        print(f"AI journey generation failed: {e}")
-        return {
-            "milestones": [
-                {"week": i+1, "objective": f"Week {i+1} learning", "dependencies": [], "resources": []}
-                for i in range(duration)
-            ]
-        }
-
-@router.get("")
-async def get_goals(user_id: str = Depends(get_current_user)):
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.fromisoformat(raw["c"])
+        last_id = ObjectId(raw["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": last_id}}
+    ]}
+
+def goal_projection(view: str = "full", fields: Optional[str] = None, required=()):
+    """
+    MongoDB projection for a `view` / `fields` choice, plus the variant name
+    that keeps its cache entries and ETags apart from the whole goal's.
+    `required` fields are always fetched. Returns (None, "") for the whole goal.
+    """
+    if fields:
+        names = sorted({name.strip() for name in fields.split(",") if name.strip()})
+        unknown = [name for name in names if name not in GOAL_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown goal fields: {', '.join(unknown)}")
+        if names:
+            return dict.fromkeys([*names, *required], 1), "+".join(names)
+    if view == "summary":
+        # Milestones are most of a goal's size and list views don't show them
+        return {"milestones": 0}, "summary"
+    return None, ""
+
+def parse_weeks(weeks: Optional[str]):
+    """'3-6' -> (3, 6), '4' -> (4, 4), None -> every week."""
+    if not weeks:
+        return 1, MAX_WEEK
+    first, _, last = weeks.partition("-")
+    try:
+        first, last = int(first), int(last or first)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid weeks, expected e.g. 3-6")
+    if first < 1 or last < first:
+        raise HTTPException(status_code=400, detail="Invalid weeks, expected e.g. 3-6")
+    return first, min(last, MAX_WEEK)
+
+def goal_etag(goal_id: str, version, variant: str = "") -> str:
+    # Goals written before versioning count as version 0 until their next change
+    return f'"{goal_id}.{version or 0}{"." + variant if variant else ""}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+async def current_etag(db, goal_id: str, user_id: str, variant: str = "") -> str:
+    """ETag of a goal from a lookup that only returns its version."""
+    goal = await db.goals.find_one({"_id": ObjectId(goal_id), "user_id": user_id}, {"version": 1})
+    if goal is None:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    return goal_etag(goal_id, goal.get("version"), variant)
+
+async def stream_goals(cursor):
+    async for goal in cursor:
+        yield goal_adapter.dump_json(goal) + b"\n"
+
+def _count_milestones(milestones, status: Optional[str] = None, week: Optional[int] = None) -> dict:
+    conditions = []
+    if status is not None:
+        conditions.append({"$eq": ["$$m.status", status]})
+    if week is not None:
+        conditions.append({"$eq": ["$$m.week", week]})
+    return {"$size": {"$filter": {"input": milestones, "as": "m", "cond": {"$and": conditions}}}}
+
+def milestone_update_pipeline(week: int, status: Optional[str] = None) -> list:
+    """
+    Update pipeline that sets the status of the milestone(s) for `week` and
+    keeps completed_count / in_progress_count, progress and status in step,
+    all inside one atomic server-side update.
+
+    Counters are adjusted by the difference between the old and new status of
+    the matched milestone. Goals created before the counters existed get a
+    one-off recount instead.
+    """
+    milestones = {"$ifNull": ["$milestones", []]}
+
+    def maintained(field: str, counted_status: str):
+        current = {"$ifNull": [f"${field}", _count_milestones(milestones, status=counted_status)]}
+        if status is None:
+            return current
+        gained = [_count_milestones(milestones, week=week)] if status == counted_status else []
+        lost = _count_milestones(milestones, status=counted_status, week=week)
+        return {"$subtract": [{"$add": [current, *gained]}, lost]}
+
+    stage = {
+        "completed_count": maintained("completed_count", "completed"),
+        "in_progress_count": maintained("in_progress_count", "in_progress"),
+        "milestone_count": {"$size": milestones},
+        "current_week": week,
+        "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    }
+    if status is not None:
+        stage["milestones"] = {"$map": {"input": milestones, "as": "m", "in": {"$cond": [
+            {"$eq": ["$$m.week", week]},
+            {"$mergeObjects": ["$$m", {"status": status}]},
+            "$$m"
+        ]}}}
+
+    progress = {"$cond": [
+        {"$gt": ["$milestone_count", 0]},
+        {"$toInt": {"$floor": {"$multiply": [{"$divide": ["$completed_count", "$milestone_count"]}, 100]}}},
+        0
+    ]}
+    goal_status = {"$switch": {"branches": [
+        {"case": {"$eq": ["$progress", 100]}, "then": "completed"},
+        {"case": {"$gt": ["$progress", 0]}, "then": "in_progress"}
+    ], "default": "not_started"}}
+
+    return [{"$set": stage}, {"$set": {"progress": progress}}, {"$set": {"status": goal_status}}]
+
+def milestone_update_outcome(goal: dict, week: int, status: Optional[str] = None) -> dict:
+    """
+    What milestone_update_pipeline leaves behind, computed from the goal as
+    it was before the update (milestone weeks and statuses are enough).
+    """
+    statuses = [status if status is not None and m.get("week") == week else m.get("status")
+                for m in goal.get("milestones") or []]
+    completed = statuses.count("completed")
+    progress = math.floor(completed / len(statuses) * 100) if statuses else 0
+    if progress == 100:
+        goal_status = "completed"
+    elif progress > 0:
+        goal_status = "in_progress"
+    else:
+        goal_status = "not_started"
+    return {"progress": progress, "status": goal_status, "completed_count": completed}
+
+@router.get("", response_model=GoalPage)
+async def get_goals(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    view: Literal["full", "summary"] = "full",
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    List the user's goals, newest first.
+
+    Pages are `limit` goals long; pass the returned `next_cursor` as `after`
+    to get the next one. With `stream=true` goals are written as NDJSON while
+    the cursor yields them (all remaining goals unless `limit` is given).
+
+    `view=summary` leaves out the milestones; `fields=title,progress` returns
+    only the named fields, plus _id and the created_at the cursor needs.
+    """
     db = get_database()
-    goals = await db.goals.find({"user_id": user_id}).to_list(100)
-    for goal in goals:
-        goal["_id"] = str(goal["_id"])
-    return {"goals": goals}
 
-@router.post("")
-async def create_goal(goal_data: dict, user_id: str = Depends(get_current_user)):
+    query = {"user_id": user_id}
+    if after:
+        query.update(decode_cursor(after))
+    projection, variant = goal_projection(view, fields, required=("created_at",))
+
+    if stream:
+        cursor = db.goals.find(query, projection).sort(GOALS_SORT).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(stream_goals(cursor), media_type="application/x-ndjson")
+
+    generation = await goal_cache.generation(user_id)
+    page_key = f"page:{variant}:{limit or ''}:{after or ''}"
+    body = await goal_cache.get(user_id, generation, page_key)
+    if body is None:
+        page_size = limit or DEFAULT_PAGE_SIZE
+        # Fetch one extra goal to learn whether another page exists
+        goals = await db.goals.find(query, projection).sort(GOALS_SORT).limit(page_size + 1).to_list(None)
+        next_cursor = encode_cursor(goals[page_size - 1]) if len(goals) > page_size else None
+        body = goal_page_adapter.dump_json({"goals": goals[:page_size], "next_cursor": next_cursor})
+        await goal_cache.put(user_id, generation, page_key, body)
+    return FastJSONResponse(body)
+
+@router.post("", response_model=GoalEnvelope)
+async def create_goal(goal_data: dict, user_id: str = Depends(admitted_user("journey"))):
+    """
+    Create a goal and queue its learning journey.
+
+    The goal is returned straight away with status "generating"; poll
+    GET /{goal_id}/journey until the milestones are filled in. Answers 429
+    over the user's journey rate and 503 while LLM work is backed up, both
+    with Retry-After.
+    """
     db = get_database()
-    
+
+    title = goal_data.get("title", "")
     duration = goal_data.get("duration", 12)
     complexity = goal_data.get("complexity", "intermediate")
-    milestones_data = await generate_learning_journey(
-        goal_data.get("title", ""), complexity, duration
-    )
-    
+
     goal = {
-        "title": goal_data.get("title", ""),
+        "title": title,
         "description": goal_data.get("description", ""),
         "category": goal_data.get("category", ""),
         "complexity": complexity,
         "duration": duration,
         "progress": 0,
-        "status": "not_started",
+        "status": GENERATING,
+        "journey_lease_until": journey_lease(),
         "user_id": user_id,
-        "milestones": milestones_data.get("milestones", []),
+        "milestones": [],
+        "milestone_count": 0,
+        "completed_count": 0,
+        "in_progress_count": 0,
         "current_week": 1,
+        "version": 1,
         "created_at": datetime.now()
     }
-    
+
     result = await db.goals.insert_one(goal)
-    goal["_id"] = str(result.inserted_id)
-    return {"goal": goal}
+    goal_id = str(result.inserted_id)
+    await goal_cache.invalidate(user_id)
+    await record_goal_change(db, user_id, after=goal)
+
+    if not journey_pool.submit(goal_id, title, complexity, duration, user_id):
+        # Pool is full or not running: use the template rather than make the user wait
+        journey = fallback_journey(duration)
+        await apply_journey(goal_id, journey, "fallback")
+        goal.update(
+            milestones=journey["milestones"],
+            milestone_count=len(journey["milestones"]),
+            status="not_started",
+            journey_source="fallback",
+            version=goal["version"] + 1
+        )
+    goal_search.index_goal(goal)
+
+    return FastJSONResponse(goal_envelope_adapter.dump_json({"goal": goal}))
 
-@router.get("/{goal_id}")
-async def get_goal(goal_id: str, user_id: str = Depends(get_current_user)):
+@router.post("/batch")
+async def batch_update(batch: BatchRequest, user_id: str = Depends(get_current_user)):
+    """
+    Apply several milestone and goal updates in one request.
+
+    Ownership and milestone weeks are checked with a single projected read,
+    then every valid operation goes out in one bulk_write. With ordered=true
+    processing stops at the first failing operation and the rest are
+    reported as skipped.
+    """
     db = get_database()
-    
-    try:
-        goal = await db.goals.find_one({"_id": ObjectId(goal_id), "user_id": user_id})
-        if goal:
-            goal["_id"] = str(goal["_id"])
-            return {"goal": goal}
+    results = [{"index": i, "status": "pending", "error": None} for i in range(len(batch.operations))]
+
+    goal_ids = {op.goal_id for op in batch.operations if ObjectId.is_valid(op.goal_id)}
+    owned, before = {}, {}
+    if goal_ids:
+        # The stats fields come along so the user_stats delta can be worked out without a recount
+        cursor = db.goals.find(
+            {"_id": {"$in": [ObjectId(goal_id) for goal_id in goal_ids]}, "user_id": user_id},
+            {"progress": 1, "status": 1, "completed_count": 1, "milestones.week": 1, "milestones.status": 1}
+        )
+        async for goal in cursor:
+            owned[str(goal["_id"])] = {m.get("week") for m in goal.get("milestones", [])}
+            before[str(goal["_id"])] = goal
+
+    requests, request_index = [], []
+    for i, op in enumerate(batch.operations):
+        if not ObjectId.is_valid(op.goal_id):
+            error = "Invalid goal ID format"
+        elif op.goal_id not in owned:
+            error = "Goal not found"
+        elif op.type == "milestone" and op.week not in owned[op.goal_id]:
+            error = "Milestone not found"
         else:
-            raise HTTPException(status_code=404, detail="Goal not found")
-    except:
+            error = None
+
+        if error:
+            results[i].update(status="failed", error=error)
+            if batch.ordered:
+                break
+            continue
+
+        goal_filter = {"_id": ObjectId(op.goal_id), "user_id": user_id}
+        if op.type == "milestone":
+            goal_filter["milestones.week"] = op.week
+            requests.append(UpdateOne(goal_filter, milestone_update_pipeline(op.week, op.status)))
+        else:
+            update_data = op.update.dict(exclude_unset=True)
+            if not update_data:
+                results[i]["status"] = "applied"
+                continue
+            requests.append(UpdateOne(goal_filter, {"$set": update_data, "$inc": {"version": 1}}))
+        request_index.append(i)
+
+    applied = set(request_index)
+    if requests:
+        try:
+            await db.goals.bulk_write(requests, ordered=batch.ordered)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                i = request_index[write_error["index"]]
+                results[i].update(status="failed", error=write_error.get("errmsg", "Write failed"))
+                applied.discard(i)
+            if batch.ordered:
+                first_failed = request_index[e.details["writeErrors"][0]["index"]]
+                applied = {i for i in applied if i < first_failed}
+
+    for i in applied:
+        results[i]["status"] = "applied"
+    if applied:
+        await goal_cache.invalidate(user_id)
+        # bulk_write doesn't return the documents, so replay the applied operations
+        # on the goals as read above and apply their summed stats delta once
+        after = dict(before)
+        for i in sorted(applied):
+            op = batch.operations[i]
+            goal = after[op.goal_id]
+            if op.type == "milestone":
+                milestones = [{**m, "status": op.status} if m.get("week") == op.week else m
+                              for m in goal.get("milestones") or []]
+                after[op.goal_id] = {**goal, **milestone_update_outcome(goal, op.week, op.status),
+                                     "milestones": milestones}
+            else:
+                after[op.goal_id] = {**goal, **op.update.dict(exclude_unset=True)}
+        await record_goal_changes(db, user_id, [(before[goal_id], goal) for goal_id, goal in after.items()
+                                                if goal is not before[goal_id]])
+        if any(batch.operations[i].type == "goal" for i in applied):
+            goal_search.invalidate(user_id)
+    for result in results:
+        if result["status"] == "pending":
+            result["status"] = "skipped"
+
+    return {
+        "results": results,
+        "applied": sum(1 for r in results if r["status"] == "applied"),
+        "failed": sum(1 for r in results if r["status"] == "failed")
+    }
+
+@router.get("/journey-cache")
+async def get_journey_cache_stats(user_id: str = Depends(get_current_user)):
+    return journey_cache.stats()
+
+@router.get("/read-cache")
+async def get_read_cache_stats(user_id: str = Depends(get_current_user)):
+    return goal_cache.stats()
+
+@router.get("/search", response_model=GoalSearchPage)
+async def search_goals(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_SEARCH_SIZE, ge=1, le=MAX_SEARCH_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Search the user's goals by title, description, category and milestone
+    objectives, best match first. Goals come back without milestones and
+    with a `score`; pass `next_offset` as `offset` for the next page.
+    """
+    goals, has_more, backend = await goal_search.search(user_id, q, offset, limit)
+    return FastJSONResponse(goal_search_page_adapter.dump_json({
+        "goals": goals,
+        "next_offset": offset + len(goals) if has_more else None,
+        "backend": backend
+    }))
+
+@router.get("/search-index")
+async def get_search_index_stats(user_id: str = Depends(get_current_user)):
+    return goal_search.stats()
+
+@router.get("/{goal_id}", response_model=GoalEnvelope)
+async def get_goal(goal_id: str, view: Literal["full", "summary"] = "full", fields: Optional[str] = None,
+                   if_none_match: Optional[str] = Header(None), user_id: str = Depends(get_current_user)):
+    """
+    Get one goal. Responses carry an ETag; send it back in If-None-Match to
+    get a 304 from a version-only lookup when the goal hasn't changed.
+    `view` and `fields` work as for the goal list, with version in place of
+    created_at; load milestones a few weeks at a time from
+    GET /{goal_id}/milestones.
+    """
+    db = get_database()
+
+    if not ObjectId.is_valid(goal_id):
         raise HTTPException(status_code=400, detail="Invalid goal ID")
+    projection, variant = goal_projection(view, fields, required=("version",))
+
+    # Cached as b'<etag>\n<body>' so a hit can answer If-None-Match without MongoDB
+    generation = await goal_cache.generation(user_id)
+    cache_key = f"goal:{goal_id}:{variant}" if variant else f"goal:{goal_id}"
+    cached = await goal_cache.get(user_id, generation, cache_key)
+    if cached is not None:
+        etag, body = cached.split(b"\n", 1)
+        etag = etag.decode()
+    else:
+        if if_none_match:
+            etag = await current_etag(db, goal_id, user_id, variant)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
+        goal = await db.goals.find_one({"_id": ObjectId(goal_id), "user_id": user_id}, projection)
+        if not goal:
+            raise HTTPException(status_code=404, detail="Goal not found")
+        etag = goal_etag(goal_id, goal.get("version"), variant)
+        body = goal_envelope_adapter.dump_json({"goal": goal})
+        await goal_cache.put(user_id, generation, cache_key, etag.encode() + b"\n" + body)
+
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return FastJSONResponse(body, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@router.get("/{goal_id}/milestones", response_model=MilestoneRange)
+async def get_milestones(goal_id: str, weeks: Optional[str] = None, if_none_match: Optional[str] = Header(None),
+                         user_id: str = Depends(get_current_user)):
+    """
+    Milestones for a range of weeks (`weeks=3-6`, or `weeks=4`), so a plan
+    can be loaded as it scrolls instead of all at once. The range is cut
+    server-side with $filter; milestone_count is the goal's total. Carries
+    an ETag like GET /{goal_id}.
+    """
+    db = get_database()
+
+    if not ObjectId.is_valid(goal_id):
+        raise HTTPException(status_code=400, detail="Invalid goal ID format")
+    first, last = parse_weeks(weeks)
+    variant = f"weeks{first}-{last}"
 
-@router.put("/{goal_id}")
+    if if_none_match:
+        etag = await current_etag(db, goal_id, user_id, variant)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    milestones = {"$ifNull": ["$milestones", []]}
+    goals = await db.goals.aggregate([
+        {"$match": {"_id": ObjectId(goal_id), "user_id": user_id}},
+        {"$project": {
+            "version": 1,
+            "milestone_count": {"$size": milestones},
+            "milestones": {"$filter": {"input": milestones, "as": "m", "cond": {"$and": [
+                {"$gte": ["$$m.week", first]}, {"$lte": ["$$m.week", last]}
+            ]}}}
+        }}
+    ]).to_list(1)
+    if not goals:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    goal = goals[0]
+
+    body = milestone_range_adapter.dump_json({
+        "goal_id": goal_id,
+        "weeks": [first, last],
+        "milestones": goal["milestones"],
+        "milestone_count": goal["milestone_count"]
+    })
+    etag = goal_etag(goal_id, goal.get("version"), variant)
+    return FastJSONResponse(body, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@router.get("/{goal_id}/journey")
+async def get_journey_status(goal_id: str, user_id: str = Depends(get_current_user)):
+    db = get_database()
+
+    if not ObjectId.is_valid(goal_id):
+        raise HTTPException(status_code=400, detail="Invalid goal ID format")
+
+    goal = await db.goals.find_one(
+        {"_id": ObjectId(goal_id), "user_id": user_id},
+        {"status": 1, "journey_source": 1}
+    )
+    if not goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+
+    job = journey_pool.job(goal_id) or {}
+    if goal["status"] == GENERATING:
+        status = job.get("status", "queued")
+    else:
+        status = "fallback" if goal.get("journey_source") == "fallback" else "ready"
+
+    return {
+        "goal_id": goal_id,
+        "status": status,
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error")
+    }
+
+@router.put("/{goal_id}", response_model=GoalEnvelope)
 async def update_goal(goal_id: str, goal_data: GoalUpdate, user_id: str = Depends(get_current_user)):
     """
     Update a specific goal by ID
@@ -133,28 +547,28 @@ async def update_goal(goal_id: str, goal_data: GoalUpdate, user_id: str = Depend
     if not ObjectId.is_valid(goal_id):
         raise HTTPException(status_code=400, detail="Invalid goal ID format")
     
-    # Check if goal exists and belongs to user
-    existing_goal = await db.goals.find_one({
-        "_id": ObjectId(goal_id),
-        "user_id": user_id
-    })
-    
-    if not existing_goal:
-        raise HTTPException(status_code=404, detail="Goal not found or access denied")
-    
     # Prepare update data (exclude unset fields)
     update_data = goal_data.dict(exclude_unset=True)
+    goal_filter = {"_id": ObjectId(goal_id), "user_id": user_id}
+
+    # Update the goal, getting back the previous version for the stats delta
+    if update_data:
+        existing_goal = await db.goals.find_one_and_update(goal_filter, {"$set": update_data, "$inc": {"version": 1}})
+    else:
+        existing_goal = await db.goals.find_one(goal_filter)
     
-    # Update the goal
-    await db.goals.update_one(
-        {"_id": ObjectId(goal_id)},
-        {"$set": update_data}
-    )
-    
-    # Return updated goal
-    updated_goal = await db.goals.find_one({"_id": ObjectId(goal_id)})
-    updated_goal["_id"] = str(updated_goal["_id"])
-    return {"goal": updated_goal}
+    if not existing_goal:
+        raise HTTPException(status_code=404, detail="Goal not found or access denied")
+
+    if update_data:
+        await goal_cache.invalidate(user_id)
+    updated_goal = {**existing_goal, **update_data}
+    if update_data:
+        updated_goal["version"] = (existing_goal.get("version") or 0) + 1
+        goal_search.index_goal(updated_goal)
+    await record_goal_change(db, user_id, before=existing_goal, after=updated_goal)
+
+    return FastJSONResponse(goal_envelope_adapter.dump_json({"goal": updated_goal}))
 
 @router.delete("/{goal_id}")
 async def delete_goal(goal_id: str, user_id: str = Depends(get_current_user)):
@@ -166,89 +580,88 @@ async def delete_goal(goal_id: str, user_id: str = Depends(get_current_user)):
     if not ObjectId.is_valid(goal_id):
         raise HTTPException(status_code=400, detail="Invalid goal ID format")
     
-    # Check if goal exists and belongs to user
-    existing_goal = await db.goals.find_one({
-        "_id": ObjectId(goal_id),
-        "user_id": user_id
-    })
+    # Delete the goal if it belongs to the user
+    existing_goal = await db.goals.find_one_and_delete(
+        {"_id": ObjectId(goal_id), "user_id": user_id},
+        projection={"status": 1, "progress": 1, "completed_count": 1, "milestones.status": 1}
+    )
     
     if not existing_goal:
         raise HTTPException(status_code=404, detail="Goal not found or access denied")
-    
-    # Delete the goal
-    result = await db.goals.delete_one({"_id": ObjectId(goal_id)})
-    
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=500, detail="Failed to delete goal")
+
+    await goal_cache.invalidate(user_id)
+    goal_search.remove_goal(user_id, goal_id)
+    await record_goal_change(db, user_id, before=existing_goal)
     
     return {"message": "Goal deleted successfully", "deleted_id": goal_id}
 
 @router.put("/{goal_id}/milestone/{week_number}")
 async def update_milestone(goal_id: str, week_number: int, update_data: dict, user_id: str = Depends(get_current_user)):
     db = get_database()
-    
-    try:
-        goal = await db.goals.find_one({"_id": ObjectId(goal_id), "user_id": user_id})
-        if not goal:
-            raise HTTPException(status_code=404, detail="Goal not found")
-        
-        updated = False
-        for milestone in goal.get("milestones", []):
-            if milestone["week"] == week_number:
-                if "status" in update_data:
-                    milestone["status"] = update_data["status"]
-                updated = True
-                break
-        
-        if updated:
-            total_milestones = len(goal.get("milestones", []))
-            completed_milestones = sum(1 for m in goal.get("milestones", []) if m.get("status") == "completed")
-            
-            progress = int((completed_milestones / total_milestones) * 100) if total_milestones > 0 else 0
-            status = "completed" if progress == 100 else "in_progress" if progress > 0 else "not_started"
-            
-            await db.goals.update_one(
-                {"_id": ObjectId(goal_id)},
-                {"$set": {
-                    "milestones": goal["milestones"],
-                    "progress": progress,
-                    "status": status,
-                    "current_week": week_number
-                }}
-            )
-            
-            return {"message": "Milestone updated successfully"}
-        else:
-            raise HTTPException(status_code=404, detail="Milestone not found")
-            
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+
+    if not ObjectId.is_valid(goal_id):
+        raise HTTPException(status_code=400, detail="Invalid goal ID format")
+
+    status = update_data.get("status")
+    if status is not None and status not in MILESTONE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid milestone status: {status}")
+
+    # The previous version feeds the user_stats delta; the new values are derived from it
+    goal = await db.goals.find_one_and_update(
+        {"_id": ObjectId(goal_id), "user_id": user_id, "milestones.week": week_number},
+        milestone_update_pipeline(week_number, status),
+        projection={"progress": 1, "status": 1, "completed_count": 1, "milestones.week": 1, "milestones.status": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+
+    if goal is None:
+        # Only the failure path pays for a second lookup to pick the right error
+        exists = await db.goals.count_documents({"_id": ObjectId(goal_id), "user_id": user_id}, limit=1)
+        raise HTTPException(status_code=404, detail="Milestone not found" if exists else "Goal not found")
+
+    await goal_cache.invalidate(user_id)
+    updated = milestone_update_outcome(goal, week_number, status)
+    await record_goal_change(db, user_id, before=goal, after=updated)
+
+    return {
+        "message": "Milestone updated successfully",
+        "progress": updated["progress"],
+        "status": updated["status"]
+    }
 
 @router.get("/{goal_id}/progress")
-async def get_goal_progress(goal_id: str, user_id: str = Depends(get_current_user)):
+async def get_goal_progress(goal_id: str, if_none_match: Optional[str] = Header(None),
+                            user_id: str = Depends(get_current_user)):
     db = get_database()
-    
-    try:
-        goal = await db.goals.find_one({"_id": ObjectId(goal_id), "user_id": user_id})
-        if not goal:
-            raise HTTPException(status_code=404, detail="Goal not found")
-        
-        milestones = goal.get("milestones", [])
-        total = len(milestones)
-        completed = sum(1 for m in milestones if m.get("status") == "completed")
-        in_progress = sum(1 for m in milestones if m.get("status") == "in_progress")
-        
-        return {
-            "progress": goal.get("progress", 0),
-            "status": goal.get("status", "not_started"),
-            "milestones": {
-                "total": total,
-                "completed": completed,
-                "in_progress": in_progress,
-                "not_started": total - completed - in_progress
-            },
-            "current_week": goal.get("current_week", 1)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+
+    if not ObjectId.is_valid(goal_id):
+        raise HTTPException(status_code=400, detail="Invalid goal ID format")
+
+    if if_none_match:
+        etag = await current_etag(db, goal_id, user_id)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    goal = await db.goals.find_one(
+        {"_id": ObjectId(goal_id), "user_id": user_id},
+        {"progress": 1, "status": 1, "current_week": 1, "version": 1, "milestones.status": 1}
+    )
+    if not goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+
+    milestones = goal.get("milestones", [])
+    total = len(milestones)
+    completed = sum(1 for m in milestones if m.get("status") == "completed")
+    in_progress = sum(1 for m in milestones if m.get("status") == "in_progress")
+
+    return FastJSONResponse({
+        "progress": goal.get("progress", 0),
+        "status": goal.get("status", "not_started"),
+        "milestones": {
+            "total": total,
+            "completed": completed,
+            "in_progress": in_progress,
+            "not_started": total - completed - in_progress
+        },
+        "current_week": goal.get("current_week", 1)
+    }, headers={"ETag": goal_etag(goal_id, goal.get("version")), "Cache-Control": "private, no-cache"})
@@ -1,21 +1,153 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+from datetime import datetime
 from app.database import get_database
 from app.middleware.auth import get_current_user
+from app.user_stats import get_user_stats, rebuild_user_stats
 
 router = APIRouter()
 
+WEEK_MS = 7 * 24 * 60 * 60 * 1000
+DAY_MS = 24 * 60 * 60 * 1000
+
+def _completed_milestones():
+    return {"$size": {"$filter": {
+        "input": {"$ifNull": ["$milestones", []]},
+        "as": "m",
+        "cond": {"$eq": ["$$m.status", "completed"]}
+    }}}
+
+def progress_pipeline(match: dict, now: datetime) -> list:
+    """
+    Aggregation computing progress metrics for every goal matching `match`.
+
+    Check-ins are reduced to one entry per goal week inside the $lookup, so
+    only the finished metrics leave the server. Weeks are counted from the
+    goal's created_at, week 1 being the first.
+    """
+    return [
+        {"$match": match},
+        {"$project": {
+            "title": 1,
+            "status": 1,
+            "progress": 1,
+            "created_at": 1,
+            "goal_id": {"$toString": "$_id"},
+            "total": {"$ifNull": ["$milestone_count", {"$size": {"$ifNull": ["$milestones", []]}}]},
+            "completed": {"$ifNull": ["$completed_count", _completed_milestones()]},
+        }},
+        {"$lookup": {
+            "from": "checkins",
+            "localField": "goal_id",
+            "foreignField": "goal_id",
+            "let": {"created_at": "$created_at"},
+            "pipeline": [
+                {"$group": {
+                    "_id": {"$floor": {"$divide": [{"$subtract": ["$checkin_date", "$$created_at"]}, WEEK_MS]}},
+                    "last": {"$max": "$checkin_date"},
+                    "count": {"$sum": 1}
+                }},
+                {"$sort": {"_id": 1}},
+                {"$group": {
+                    "_id": None,
+                    "weeks": {"$push": "$_id"},
+                    "last": {"$max": "$last"},
+                    "count": {"$sum": "$count"}
+                }}
+            ],
+            "as": "checkins"
+        }},
+        {"$set": {
+            "checkins": {"$ifNull": [{"$first": "$checkins"}, {"weeks": [], "last": None, "count": 0}]},
+            "weeks_elapsed": {"$add": [
+                {"$floor": {"$divide": [{"$subtract": [now, "$created_at"]}, WEEK_MS]}}, 1
+            ]}
+        }},
+        {"$set": {
+            "velocity": {"$divide": ["$completed", "$weeks_elapsed"]},
+            # Walk the sorted check-in weeks counting runs of consecutive weeks
+            "streaks": {"$reduce": {
+                "input": "$checkins.weeks",
+                "initialValue": {"prev": None, "current": 0, "longest": 0},
+                "in": {"$let": {
+                    "vars": {"run": {"$cond": [
+                        {"$eq": ["$$this", {"$add": ["$$value.prev", 1]}]},
+                        {"$add": ["$$value.current", 1]},
+                        1
+                    ]}},
+                    "in": {"prev": "$$this", "current": "$$run", "longest": {"$max": ["$$value.longest", "$$run"]}}
+                }}
+            }}
+        }},
+        {"$project": {
+            "_id": 0,
+            "goal_id": 1,
+            "title": 1,
+            "status": 1,
+            "progress": 1,
+            "progress_metrics": {
+                "completion_rate": {"$cond": [
+                    {"$gt": ["$total", 0]},
+                    {"$round": [{"$multiply": [{"$divide": ["$completed", "$total"]}, 100]}, 1]},
+                    0
+                ]},
+                "weekly_velocity": {"$round": ["$velocity", 2]},
+                "milestones_completed": "$completed",
+                "milestones_total": "$total",
+                "weeks_elapsed": "$weeks_elapsed",
+                "checkins_total": "$checkins.count",
+                # A streak is still current if its last check-in week is this week or the previous one
+                "current_streak_weeks": {"$cond": [
+                    {"$gte": ["$streaks.prev", {"$subtract": ["$weeks_elapsed", 2]}]},
+                    "$streaks.current",
+                    0
+                ]},
+                "longest_streak_weeks": "$streaks.longest",
+                "last_checkin_at": "$checkins.last",
+                "days_since_last_checkin": {"$cond": [
+                    {"$eq": ["$checkins.last", None]},
+                    None,
+                    {"$round": [{"$divide": [{"$subtract": [now, "$checkins.last"]}, DAY_MS]}, 1]}
+                ]},
+                "projected_finish_week": {"$cond": [
+                    {"$gt": ["$velocity", 0]},
+                    {"$ceil": {"$divide": ["$total", "$velocity"]}},
+                    None
+                ]}
+            }
+        }}
+    ]
+
+@router.get("")
+async def get_all_progress(user_id: str = Depends(get_current_user)):
+    """Progress metrics for all of the user's goals in a single aggregation."""
+    db = get_database()
+
+    pipeline = progress_pipeline({"user_id": user_id}, datetime.now())
+    goals = await db.goals.aggregate(pipeline).to_list(None)
+    return {"goals": goals}
+
+@router.get("/summary")
+async def get_progress_summary(user_id: str = Depends(get_current_user)):
+    """Dashboard totals from the user's materialized user_stats document."""
+    return await get_user_stats(get_database(), user_id)
+
+@router.post("/summary/rebuild")
+async def rebuild_progress_summary(user_id: str = Depends(get_current_user)):
+    """Recompute the user's dashboard totals from their goals and check-ins."""
+    db = get_database()
+    await rebuild_user_stats(db, user_id)
+    return await get_user_stats(db, user_id)
+
 @router.get("/{goal_id}")
 async def get_goal_progress(goal_id: str, user_id: str = Depends(get_current_user)):
     db = get_database()
-    
-    goal = await db.goals.find_one({"_id": goal_id, "user_id": user_id})
-    checkins = await db.checkins.find({"goal_id": goal_id}).to_list(100)
-    
-    return {
-        "goal": goal,
-        "checkins": checkins,
-        "progress_metrics": calculate_metrics(goal, checkins)
-    }
-
-def calculate_metrics(goal, checkins):
-    return {"completion_rate": 0, "velocity": 0}
\ No newline at end of file
+
+    if not ObjectId.is_valid(goal_id):
+        raise HTTPException(status_code=400, detail="Invalid goal ID format")
+
+    pipeline = progress_pipeline({"_id": ObjectId(goal_id), "user_id": user_id}, datetime.now())
+    results = await db.goals.aggregate(pipeline).to_list(1)
+    if not results:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    return results[0]
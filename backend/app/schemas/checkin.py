@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+class CheckinCreate(BaseModel):
+    goal_id: str
+    progress_notes: str = ""
+    completed_milestones: list = []
+    challenges: str = ""
+    next_steps: str = ""
+
+class BulkCheckinRequest(BaseModel):
+    checkins: List[CheckinCreate] = Field(..., min_length=1, max_length=500)
@@ -1,18 +1,21 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, PlainSerializer, PlainValidator, TypeAdapter, WithJsonSchema
+from typing import Any, List, Literal, Optional, Union
+from typing_extensions import Annotated, TypedDict
 from datetime import datetime
 from bson import ObjectId
 
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+def validate_object_id(value) -> ObjectId:
+    if not ObjectId.is_valid(value):
+        raise ValueError("Invalid objectid")
+    return ObjectId(value)
 
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid objectid")
-        return ObjectId(v)
+# Accepts an ObjectId or its hex string, always serialized as the string
+PyObjectId = Annotated[
+    ObjectId,
+    PlainValidator(validate_object_id),
+    PlainSerializer(str, return_type=str),
+    WithJsonSchema({"type": "string"})
+]
 
 class GoalBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=100)
@@ -34,15 +37,81 @@ class GoalUpdate(BaseModel):
     status: Optional[str] = None
     current_week: Optional[int] = Field(None, ge=1)
 
-class GoalResponse(GoalBase):
-    id: PyObjectId
+class MilestoneOperation(BaseModel):
+    type: Literal["milestone"]
+    goal_id: str
+    week: int
+    status: Literal["not_started", "in_progress", "completed"]
+
+class GoalOperation(BaseModel):
+    type: Literal["goal"]
+    goal_id: str
+    update: GoalUpdate
+
+BatchOperation = Annotated[Union[MilestoneOperation, GoalOperation], Field(discriminator="type")]
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=500)
+    ordered: bool = True
+
+# Response shapes are TypedDicts so the adapters below can serialize goal
+# documents straight from MongoDB without validating or copying them first.
+# Keys that are not declared here are left out of responses.
+
+class MilestoneResponse(TypedDict, total=False):
+    week: int
+    objective: str
+    # Passed through as the LLM wrote them, which is not always a list of strings
+    dependencies: List[Any]
+    resources: List[Any]
+    status: str
+
+class GoalResponse(TypedDict, total=False):
+    _id: PyObjectId
+    title: str
+    description: str
+    category: str
+    complexity: str
+    duration: int
     progress: int
     status: str
     user_id: str
-    milestones: list
+    milestones: List[MilestoneResponse]
+    milestone_count: int
+    completed_count: int
+    in_progress_count: int
     current_week: int
+    journey_source: str
+    version: int
     created_at: datetime
 
-    class Config:
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
\ No newline at end of file
+class GoalEnvelope(TypedDict):
+    goal: GoalResponse
+
+class GoalPage(TypedDict):
+    goals: List[GoalResponse]
+    next_cursor: Optional[str]
+
+class GoalSearchHit(GoalResponse, total=False):
+    score: float
+
+class GoalSearchPage(TypedDict):
+    goals: List[GoalSearchHit]
+    next_offset: Optional[int]
+    backend: str
+
+class MilestoneRange(TypedDict):
+    goal_id: str
+    weeks: List[int]  # [first, last], inclusive
+    milestones: List[MilestoneResponse]
+    milestone_count: int
+
+# Field names a `fields` projection may ask for; _id always comes back
+GOAL_FIELDS = frozenset(GoalResponse.__annotations__) - {"_id"}
+
+# Built once at import; dump_json() runs entirely in pydantic-core
+goal_adapter = TypeAdapter(GoalResponse)
+goal_envelope_adapter = TypeAdapter(GoalEnvelope)
+goal_page_adapter = TypeAdapter(GoalPage)
+milestone_range_adapter = TypeAdapter(MilestoneRange)
+goal_search_page_adapter = TypeAdapter(GoalSearchPage)
\ No newline at end of file
@@ -0,0 +1,291 @@
+"""
+Full-text search over a user's goals.
+
+Goal title, description, category and milestone objectives are searched,
+always within one user's goals, and results come back best match first.
+
+With GOAL_SEARCH_BACKEND=mongo (the default) queries run against the
+goals text index declared in app.indexes. Its user_id prefix keeps a query
+to that user's index entries, so latency follows the size of the user's
+matches, not of the collection. If the text index is missing, the query
+falls back to the in-process index below and counts a fallback.
+
+GOAL_SEARCH_BACKEND=memory uses only the in-process inverted index. A
+user's index is built from their goals on their first search, then kept
+up to date by the goal write paths (index_goal / remove_goal). Up to
+GOAL_SEARCH_USERS users are indexed per worker, least recently searched
+first out, and each is rebuilt after GOAL_SEARCH_TTL seconds so writes
+made on other workers show up. Terms are lowercased words with a light
+plural/suffix stem and stopwords removed; phrases and negation are only
+understood by the MongoDB backend. Like $text, a goal matches when any
+query term does, and goals with equal scores are ranked by id. Each
+term's postings are also grouped by weight and kept in id order, so a
+search walks them in ranking order and stops once no goal it hasn't seen
+could still make the requested page; its cost follows the page size
+rather than how many of the user's goals share a common word, and a
+longer page always starts with the shorter one.
+"""
+import os
+import re
+import math
+import time
+import heapq
+import bisect
+from collections import OrderedDict
+from bson import ObjectId
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+from app.database import get_database
+from app.log import get_logger
+from app.metrics import register_stats
+
+log = get_logger("app.search")
+
+GOAL_SEARCH_BACKEND = os.getenv("GOAL_SEARCH_BACKEND", "mongo")  # "mongo" or "memory"
+GOAL_SEARCH_USERS = int(os.getenv("GOAL_SEARCH_USERS", "1000"))  # users indexed in memory per worker
+GOAL_SEARCH_TTL = float(os.getenv("GOAL_SEARCH_TTL", "300"))  # seconds before a user's index is rebuilt
+
+# Same weights as the text index in app.indexes, so both backends rank alike
+FIELD_WEIGHTS = {"title": 10, "category": 5, "description": 2, "milestones.objective": 1}
+
+# idf is rounded to a multiple of 1/IDF_STEPS, which keeps every score a sum
+# of exact binary fractions: a goal scores the same whichever order its terms
+# are added in, so ties between goals are real ties and broken by id
+IDF_STEPS = 2 ** 20
+
+# Goals come back without milestones; GET /api/goals/{id}/milestones loads them
+RESULT_PROJECTION = {"milestones": 0}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it of on or that the this to was what when where which "
+    "who why will with my me your you".split()
+)
+WORD = re.compile(r"\w+")
+
+def stem(word: str) -> str:
+    """Plural and -ed/-ing endings off, roughly Porter's step 1: classes -> class, running -> run."""
+    if word.endswith("sses") or word.endswith("ies"):
+        word = word[:-2] if word.endswith("sses") else word[:-3] + "y"
+    elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            # running -> runn -> run, but not fill -> fil
+            if word[-1] == word[-2] and word[-1] not in "lsz":
+                word = word[:-1]
+            break
+    return word
+
+def terms(text: str) -> list:
+    return [stem(word) for word in WORD.findall((text or "").lower()) if word not in STOPWORDS]
+
+def goal_texts(goal: dict):
+    """(field, text) pairs of a goal, with one pair per milestone objective."""
+    for field in ("title", "category", "description"):
+        yield field, goal.get(field) or ""
+    for milestone in goal.get("milestones") or []:
+        yield "milestones.objective", milestone.get("objective") or ""
+
+class UserIndex:
+    """Inverted index of one user's goals: term -> {goal_id: weighted term count}."""
+
+    __slots__ = ("postings", "buckets", "goals", "built_at")
+
+    def __init__(self, built_at: float):
+        self.postings = {}
+        self.buckets = {}  # term -> {weight: sorted list of goal_ids}, the same postings grouped for best-first walks
+        self.goals = {}  # goal_id -> terms, to undo the goal's postings
+        self.built_at = built_at
+
+    def add(self, goal: dict):
+        goal_id = str(goal["_id"])
+        self.remove(goal_id)
+        counts = {}
+        for field, text in goal_texts(goal):
+            weight = FIELD_WEIGHTS[field]
+            for term in terms(text):
+                counts[term] = counts.get(term, 0) + weight
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[goal_id] = count
+            bisect.insort(self.buckets.setdefault(term, {}).setdefault(count, []), goal_id)
+        self.goals[goal_id] = tuple(counts)
+
+    def remove(self, goal_id: str):
+        for term in self.goals.pop(goal_id, ()):
+            postings = self.postings[term]
+            buckets = self.buckets[term]
+            weight = postings.pop(goal_id)
+            members = buckets[weight]
+            del members[bisect.bisect_left(members, goal_id)]
+            if not buckets[weight]:
+                del buckets[weight]
+            if not postings:
+                del self.postings[term]
+                del self.buckets[term]
+
+    def search(self, query_terms: list, count: int) -> list:
+        """
+        The `count` best (goal_id, score) pairs over goals matching any of the
+        terms, by score and then goal_id, both descending.
+        """
+        total = len(self.goals)
+        terms_by_bound = []
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if postings:
+                # Rarer terms say more about which goal is meant
+                idf = round(math.log(1 + total / len(postings)) * IDF_STEPS) / IDF_STEPS
+                terms_by_bound.append((max(self.buckets[term]) * idf, idf, term))
+        terms_by_bound.sort(reverse=True)
+
+        scores, done = {}, []
+        for position, (bound, idf, term) in enumerate(terms_by_bound):
+            # Most any goal can still gain from the terms not walked yet
+            rest = sum(later for later, _, _ in terms_by_bound[position + 1:])
+            postings, buckets = self.postings[term], self.buckets[term]
+            walked, stopped = set(), False
+            for weight in sorted(buckets, reverse=True):
+                gain = weight * idf
+                members = buckets[weight]
+                # Highest id first, the order ties are ranked in
+                if stopped or self._cannot_place(scores, count, gain + rest, members[-1]):
+                    break
+                for index in range(len(members) - 1, -1, -1):
+                    goal_id = members[index]
+                    if goal_id in scores:
+                        scores[goal_id] += gain
+                    else:
+                        # Earlier terms may have stopped before reaching this goal
+                        scores[goal_id] = gain + sum(other.get(goal_id, 0) * other_idf for other, other_idf in done)
+                    walked.add(goal_id)
+                    if index and len(scores) == count and self._cannot_place(scores, count, gain + rest,
+                                                                              members[index - 1]):
+                        stopped = True
+                        break
+            # Goals already ranked but below where the walk stopped still get this term's share
+            for goal_id in scores.keys() - walked:
+                weight = postings.get(goal_id)
+                if weight:
+                    scores[goal_id] += weight * idf
+            done.append((postings, idf))
+        return heapq.nlargest(count, scores.items(), key=lambda item: (item[1], item[0]))
+
+    @staticmethod
+    def _cannot_place(scores: dict, count: int, best_possible: float, goal_id: str) -> bool:
+        """
+        True when `count` goals already rank above a goal scoring
+        `best_possible` with id `goal_id`, so neither it nor any goal ranking
+        below it can make the page.
+        """
+        if len(scores) < count:
+            return False
+        kth_score = heapq.nlargest(count, scores.values())[-1]
+        if kth_score != best_possible:
+            return kth_score > best_possible
+        # A tie at the boundary goes to the higher id
+        kth_id = heapq.nlargest(count, scores.items(), key=lambda item: (item[1], item[0]))[-1][0]
+        return kth_id > goal_id
+
+class GoalSearch:
+    def __init__(self, backend: str = GOAL_SEARCH_BACKEND, max_users: int = GOAL_SEARCH_USERS,
+                 ttl: float = GOAL_SEARCH_TTL):
+        self.backend = backend
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> UserIndex
+        self.searches = 0
+        self.fallbacks = 0
+        self.builds = 0
+        self.evictions = 0
+
+    async def search(self, user_id: str, query: str, offset: int, limit: int):
+        """
+        One page of the user's goals matching `query`, best first, each with a
+        `score`. Returns (goals, has_more, backend used).
+        """
+        self.searches += 1
+        if self.backend == "mongo":
+            try:
+                goals = await self._search_mongo(user_id, query, offset, limit + 1)
+                return goals[:limit], len(goals) > limit, "mongo"
+            except OperationFailure as e:
+                self.fallbacks += 1
+                log.warning("goal_search_fallback", error=str(e))
+        goals = await self._search_memory(user_id, query, offset, limit + 1)
+        return goals[:limit], len(goals) > limit, "memory"
+
+    async def _search_mongo(self, user_id: str, query: str, offset: int, count: int) -> list:
+        cursor = get_database().goals.find(
+            {"user_id": user_id, "$text": {"$search": query}},
+            {**RESULT_PROJECTION, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"}), ("_id", DESCENDING)]).skip(offset).limit(count)
+        return await cursor.to_list(None)
+
+    async def _search_memory(self, user_id: str, query: str, offset: int, count: int) -> list:
+        query_terms = terms(query)
+        if not query_terms:
+            return []
+        index = await self._user_index(user_id)
+        ranked = index.search(query_terms, offset + count)[offset:]
+        if not ranked:
+            return []
+        goals = await get_database().goals.find(
+            {"_id": {"$in": [ObjectId(goal_id) for goal_id, _ in ranked]}, "user_id": user_id},
+            RESULT_PROJECTION
+        ).to_list(None)
+        by_id = {str(goal["_id"]): goal for goal in goals}
+        # A goal deleted on another worker can still be in this index until its rebuild
+        return [{**by_id[goal_id], "score": round(score, 4)} for goal_id, score in ranked if goal_id in by_id]
+
+    async def _user_index(self, user_id: str) -> UserIndex:
+        now = time.monotonic()
+        index = self._users.get(user_id)
+        if index is not None and now - index.built_at < self.ttl:
+            self._users.move_to_end(user_id)
+            return index
+
+        index = UserIndex(now)
+        cursor = get_database().goals.find(
+            {"user_id": user_id}, {"title": 1, "description": 1, "category": 1, "milestones.objective": 1}
+        )
+        async for goal in cursor:
+            index.add(goal)
+        self.builds += 1
+        self._users[user_id] = index
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+            self.evictions += 1
+        return index
+
+    def index_goal(self, goal: dict):
+        """Reindex a created or changed goal; a no-op for users without a loaded index."""
+        index = self._users.get(goal.get("user_id"))
+        if index is not None:
+            index.add(goal)
+
+    def remove_goal(self, user_id: str, goal_id: str):
+        index = self._users.get(user_id)
+        if index is not None:
+            index.remove(goal_id)
+
+    def invalidate(self, user_id: str):
+        """Drop a user's index, for writes that don't return the changed goals."""
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "indexed_users": len(self._users),
+            "max_users": self.max_users,
+            "indexed_goals": sum(len(index.goals) for index in self._users.values()),
+            "builds": self.builds,
+            "evictions": self.evictions
+        }
+
+goal_search = GoalSearch()
+register_stats("goal_search", goal_search.stats, counters=("searches", "fallbacks", "builds", "evictions"),
+               gauges=("indexed_users", "indexed_goals"))
@@ -0,0 +1,393 @@
+"""
+AI tutor WebSocket sessions.
+
+TutorConnectionManager owns every /ws/tutor socket on this worker. It caps
+the number of sessions, gives each one a small bounded inbox, pings idle
+peers from a single sweeper task and closes the ones that stop answering,
+and drains sessions on shutdown. An idle session costs one coroutine (the
+socket reader) and a TutorSession; a worker task only exists while the
+session has messages to answer.
+
+Clients connect to /ws/tutor/{user_id}?token=<access token>; a missing or
+invalid token, or one issued to another user, is refused with close code
+1008 before the socket is accepted.
+
+Client protocol (JSON text frames):
+    -> {"type": "user_message", "message": ..., "context": ..., "stream": bool, "cache": bool, "timestamp": ...}
+    -> {"type": "reset", "context": ...}  forget the conversation in that context
+    -> {"type": "ping"} / {"type": "pong"}
+    <- {"type": "ai_response", "cached": bool, ...} or ai_response_delta frames + ai_response_done
+    <- {"type": "ping"} / {"type": "pong"}
+    <- {"type": "error", "code": ..., "message": ..., "retry_after": seconds (rate_limited/overloaded only)}
+
+Earlier turns of the conversation in the same context are sent along with
+each question, within the token budget kept by app.conversations. Opening
+questions already asked in the same context (or near duplicates of them)
+are answered from app.answer_cache; "cache": false asks for a fresh answer.
+Follow-ups are never cached, since their answer depends on the conversation.
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from app.llm import llm_gateway, LLMError, LLMNotConfigured, LLMTimeout, LLMRateLimited, LLMQuotaExceeded
+from app.log import get_logger
+from app.metrics import register_stats
+from app.admission import admission, Rejected
+from app.answer_cache import answer_cache
+from app.conversations import conversation_store
+from app.middleware.auth import verify_token
+
+log = get_logger("app.tutor")
+
+TUTOR_MAX_CONNECTIONS = int(os.getenv("TUTOR_MAX_CONNECTIONS", "5000"))
+TUTOR_QUEUE_SIZE = int(os.getenv("TUTOR_QUEUE_SIZE", "5"))
+TUTOR_QUEUE_POLICY = os.getenv("TUTOR_QUEUE_POLICY", "reject")  # "reject" newest or "drop_oldest"
+TUTOR_PING_INTERVAL = float(os.getenv("TUTOR_PING_INTERVAL", "25"))  # seconds
+TUTOR_IDLE_TIMEOUT = float(os.getenv("TUTOR_IDLE_TIMEOUT", "75"))  # seconds without any frame from the client
+TUTOR_SEND_TIMEOUT = float(os.getenv("TUTOR_SEND_TIMEOUT", "10"))  # seconds
+
+TUTOR_FALLBACK_MESSAGE = "I'm here to help with your learning goals!"
+TUTOR_ERROR_MESSAGES = {
+    LLMQuotaExceeded: "You exceeded your current quota!",
+    LLMRateLimited: "The AI tutor is busy right now. Please try again in a moment.",
+    LLMTimeout: "The AI tutor took too long to answer. Please try again.",
+}
+TUTOR_ERROR_MESSAGE = "The AI tutor is unavailable right now. Please try again later."
+TUTOR_REJECTED_MESSAGES = {
+    "rate_limited": "You're asking questions too quickly. Please wait a moment.",
+    "overloaded": "The AI tutor is busy right now. Please try again in a moment.",
+}
+
+def tutor_error_message(error: LLMError) -> str:
+    if isinstance(error, LLMNotConfigured):
+        return TUTOR_FALLBACK_MESSAGE
+    return TUTOR_ERROR_MESSAGES.get(type(error), TUTOR_ERROR_MESSAGE)
+
+# WebSocket close codes
+CLOSE_GOING_AWAY = 1001
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_SERVER_ERROR = 1011
+CLOSE_SERVICE_RESTART = 1012
+CLOSE_TRY_AGAIN_LATER = 1013
+
+def tutor_messages(user_message: str, context: str, conversation=None) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful AI tutor."},
+        *(conversation.messages() if conversation is not None else []),
+        {"role": "user", "content": f"Context: {context}\nQuestion: {user_message}"}
+    ]
+
+async def remember_answer(conversation, user_message: str, context: str, answer: str):
+    """Cache and record an answer; called once it has been sent, so none of this delays the reply."""
+    if conversation is None or conversation.empty:
+        answer_cache.put(context, user_message, answer)
+    if conversation is not None:
+        await conversation_store.record(conversation, user_message, answer)
+
+async def generate_ai_response(user_message: str, context: str, user_id: str = None, conversation=None):
+    """The answer, and whether it came from the model (False for an error message)."""
+    try:
+        answer = await llm_gateway.complete(
+            tutor_messages(user_message, context, conversation), max_tokens=150, temperature=0.7, user_id=user_id
+        )
+    except LLMError as e:
+        log.warning("tutor_llm_error", error_type=type(e).__name__, error=str(e))
+        return tutor_error_message(e), False
+    return answer, True
+
+async def stream_ai_response(session, user_message: str, context: str, timestamp, conversation=None):
+    parts = []
+
+    try:
+        async for delta in llm_gateway.stream(
+            tutor_messages(user_message, context, conversation), max_tokens=150, temperature=0.7,
+            user_id=session.user_id
+        ):
+            parts.append(delta)
+            await session.send({"type": "ai_response_delta", "delta": delta, "timestamp": timestamp})
+        complete = True
+    except LLMError as e:
+        log.warning("tutor_llm_error", error_type=type(e).__name__, error=str(e), streamed=bool(parts))
+        if not parts:
+            parts.append(tutor_error_message(e))
+        complete = False
+
+    message = "".join(parts).strip()
+    await session.send({"type": "ai_response_done", "message": message, "cached": False, "timestamp": timestamp})
+    # Only whole answers are kept; a cancelled stream never gets this far
+    if complete:
+        await remember_answer(conversation, user_message, context, message)
+
+class TutorSession:
+    __slots__ = ("websocket", "user_id", "inbox", "last_seen", "worker", "answering", "send_lock", "closed")
+
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.inbox = deque()
+        self.last_seen = time.monotonic()
+        self.worker = None  # task answering queued messages, only while there are any
+        self.answering = None  # (task, message) currently being answered
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.inbox) or self.answering is not None
+
+    async def send(self, payload: dict):
+        async with self.send_lock:
+            await asyncio.wait_for(self.websocket.send_text(json.dumps(payload)), TUTOR_SEND_TIMEOUT)
+
+    async def close(self, code: int):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # peer already gone
+
+class TutorConnectionManager:
+    def __init__(self, max_connections: int = TUTOR_MAX_CONNECTIONS, queue_size: int = TUTOR_QUEUE_SIZE,
+                 queue_policy: str = TUTOR_QUEUE_POLICY, ping_interval: float = TUTOR_PING_INTERVAL,
+                 idle_timeout: float = TUTOR_IDLE_TIMEOUT):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.queue_policy = queue_policy
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.sessions = set()
+        self.draining = False
+        self._sweeper = None
+        self.peak = 0
+        self.rejected = 0
+        self.unauthorized = 0
+        self.dropped = 0
+        self.timed_out = 0
+
+    async def start(self):
+        self.draining = False
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def drain(self, timeout: float = 10.0):
+        """Refuse new sessions, let busy ones finish for up to `timeout` seconds, then close all."""
+        self.draining = True
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+        deadline = time.monotonic() + timeout
+        while True:
+            for session in [s for s in self.sessions if not s.busy]:
+                await session.close(CLOSE_SERVICE_RESTART)
+            if not self.sessions or not any(s.busy for s in self.sessions) or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.1)
+
+        for session in list(self.sessions):
+            if session.worker is not None:
+                session.worker.cancel()
+            await session.close(CLOSE_SERVICE_RESTART)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.sessions),
+            "busy": sum(1 for s in self.sessions if s.busy),
+            "peak": self.peak,
+            "max_connections": self.max_connections,
+            "rejected": self.rejected,
+            "unauthorized": self.unauthorized,
+            "dropped_messages": self.dropped,
+            "timed_out": self.timed_out,
+            "draining": self.draining
+        }
+
+    def authenticate(self, websocket: WebSocket, user_id: str):
+        """
+        The user id from the connection's bearer token (?token= or an
+        Authorization header, since browsers can't set headers on a WebSocket),
+        or None when it is missing, invalid or issued to another user.
+        """
+        token = websocket.query_params.get("token")
+        if not token:
+            scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+            token = credentials if scheme.lower() == "bearer" else None
+        if not token:
+            return None
+        try:
+            verified = verify_token(token)
+        except HTTPException:
+            return None
+        return verified if verified == user_id else None
+
+    async def serve(self, websocket: WebSocket, user_id: str):
+        # Conversation history and rate limits are per user, so the id in the path has to be proven
+        user_id = self.authenticate(websocket, user_id)
+        if user_id is None:
+            self.unauthorized += 1
+            await websocket.close(code=CLOSE_POLICY_VIOLATION)
+            return
+        await websocket.accept()
+
+        if self.draining or len(self.sessions) >= self.max_connections:
+            self.rejected += 1
+            await websocket.close(code=CLOSE_SERVICE_RESTART if self.draining else CLOSE_TRY_AGAIN_LATER)
+            return
+
+        session = TutorSession(websocket, user_id)
+        self.sessions.add(session)
+        self.peak = max(self.peak, len(self.sessions))
+        log.info("tutor_connected", sample=True, user_id=user_id, active=len(self.sessions))
+
+        try:
+            while True:
+                data = await websocket.receive_text()
+                session.last_seen = time.monotonic()
+                await self._handle(session, json.loads(data))
+        except WebSocketDisconnect:
+            log.info("tutor_disconnected", sample=True, user_id=user_id)
+        except Exception as e:
+            log.error("tutor_session_failed", user_id=user_id, error=str(e))
+            await session.close(CLOSE_SERVER_ERROR)
+        finally:
+            session.closed = True
+            self.sessions.discard(session)
+            session.inbox.clear()
+            # Stop generating for a client that is gone; this also closes any upstream stream
+            if session.worker is not None:
+                session.worker.cancel()
+
+    async def _handle(self, session: TutorSession, message_data: dict):
+        message_type = message_data.get("type")
+
+        if message_type == "ping":
+            await session.send({"type": "pong"})
+            return
+        if message_type == "reset":
+            await conversation_store.reset(session.user_id, message_data.get("context", "learning"))
+            return
+        if message_type != "user_message":
+            return  # pongs and unknown frames only refresh last_seen
+
+        log.debug("tutor_message", sample=True, user_id=session.user_id,
+                  stream=bool(message_data.get("stream")), length=len(message_data.get("message") or ""))
+
+        try:
+            # session.user_id was verified against the connection's token in serve()
+            await admission.admit(session.user_id, "tutor")
+        except Rejected as e:
+            await session.send({
+                "type": "error",
+                "code": e.reason,
+                "message": TUTOR_REJECTED_MESSAGES[e.reason],
+                "retry_after": e.retry_after,
+                "timestamp": message_data.get("timestamp")
+            })
+            return
+
+        # A newer message supersedes a streamed answer that is still running
+        if session.answering is not None and session.answering[1].get("stream"):
+            session.answering[0].cancel()
+
+        if len(session.inbox) >= self.queue_size:
+            self.dropped += 1
+            if self.queue_policy == "drop_oldest":
+                session.inbox.popleft()
+            else:
+                await session.send({
+                    "type": "error",
+                    "code": "queue_full",
+                    "message": "Too many questions at once. Please wait for the current answer.",
+                    "timestamp": message_data.get("timestamp")
+                })
+                return
+
+        session.inbox.append(message_data)
+        if session.worker is None:
+            session.worker = asyncio.create_task(self._answer_queued(session))
+
+    async def _answer_queued(self, session: TutorSession):
+        try:
+            while session.inbox and not session.closed:
+                message_data = session.inbox.popleft()
+                answer = asyncio.create_task(self._answer(session, message_data))
+                session.answering = (answer, message_data)
+                # wait() instead of await so cancelling the answer doesn't cancel this loop
+                await asyncio.wait([answer])
+                session.answering = None
+
+                if answer.cancelled():
+                    if message_data.get("stream") and not session.closed:
+                        await session.send({
+                            "type": "ai_response_done",
+                            "message": "",
+                            "cancelled": True,
+                            "timestamp": message_data.get("timestamp")
+                        })
+                elif answer.exception() is not None:
+                    log.error("tutor_answer_failed", user_id=session.user_id, error=str(answer.exception()))
+        except Exception as e:
+            log.error("tutor_worker_failed", user_id=session.user_id, error=str(e))
+        finally:
+            if session.answering is not None:
+                session.answering[0].cancel()
+                session.answering = None
+            session.worker = None
+
+    async def _answer(self, session: TutorSession, message_data: dict):
+        user_message = message_data.get("message", "")
+        context = message_data.get("context", "learning")
+        timestamp = message_data.get("timestamp")
+        conversation = await conversation_store.load(session.user_id, context)
+
+        cached = None
+        if conversation is None or conversation.empty:
+            if message_data.get("cache", True):
+                cached = answer_cache.get(context, user_message)
+            else:
+                answer_cache.bypassed += 1
+        if cached is not None:
+            if message_data.get("stream"):
+                await session.send({"type": "ai_response_delta", "delta": cached, "timestamp": timestamp})
+                await session.send({"type": "ai_response_done", "message": cached, "cached": True, "timestamp": timestamp})
+            else:
+                await session.send({"type": "ai_response", "message": cached, "cached": True, "timestamp": timestamp})
+            if conversation is not None:
+                await conversation_store.record(conversation, user_message, cached)
+            return
+
+        if message_data.get("stream"):
+            await stream_ai_response(session, user_message, context, timestamp, conversation)
+            return
+
+        ai_response, complete = await generate_ai_response(user_message, context, session.user_id, conversation)
+        await session.send({"type": "ai_response", "message": ai_response, "cached": False, "timestamp": timestamp})
+        log.debug("tutor_answer", sample=True, user_id=session.user_id, length=len(ai_response))
+        if complete:
+            await remember_answer(conversation, user_message, context, ai_response)
+
+    async def _sweep(self):
+        """Ping quiet sessions and close the ones that stopped answering."""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            now = time.monotonic()
+            pings = []
+            for session in list(self.sessions):
+                idle = now - session.last_seen
+                if idle >= self.idle_timeout:
+                    self.timed_out += 1
+                    pings.append(session.close(CLOSE_GOING_AWAY))
+                elif idle >= self.ping_interval:
+                    pings.append(session.send({"type": "ping"}))
+            if pings:
+                await asyncio.gather(*pings, return_exceptions=True)
+
+tutor_manager = TutorConnectionManager()
+register_stats("tutor", tutor_manager.stats,
+               counters=("rejected", "unauthorized", "dropped_messages", "timed_out"), gauges=("active", "busy"))
@@ -0,0 +1,176 @@
+"""
+Materialized per-user dashboard summary.
+
+Each user has one document in `user_stats`, keyed by user id, holding goal
+counts by status, progress and milestone totals and check-in activity.
+Writes to goals and check-ins adjust it with $inc in the same request, so
+the dashboard reads it with a single _id lookup instead of scanning goals.
+
+A user without a stats document yet (or one whose document was lost) gets
+it rebuilt from the goals and checkins collections on the next write or
+read. The full rebuild doubles as a repair command:
+
+    python -m app.user_stats                # rebuild every user's stats
+    python -m app.user_stats --user <id>    # rebuild one user
+"""
+import sys
+import asyncio
+from collections import Counter
+from datetime import datetime
+from pymongo import ReplaceOne
+
+GOAL_STATUSES = ("generating", "not_started", "in_progress", "completed")
+REBUILD_BATCH_SIZE = 500
+
+def _completed(goal: dict) -> int:
+    if goal.get("completed_count") is not None:
+        return goal["completed_count"]
+    return sum(1 for m in goal.get("milestones") or [] if m.get("status") == "completed")
+
+def goal_stats_delta(before: dict = None, after: dict = None) -> dict:
+    """$inc document moving a goal's contribution from `before` to `after` (either may be None)."""
+    inc = Counter()
+    for goal, sign in ((before, -1), (after, 1)):
+        if goal is None:
+            continue
+        inc["goals_total"] += sign
+        inc[f"goals_by_status.{goal.get('status') or 'not_started'}"] += sign
+        inc["progress_total"] += sign * (goal.get("progress") or 0)
+        inc["milestones_completed"] += sign * _completed(goal)
+    return {field: value for field, value in inc.items() if value}
+
+async def _apply(db, user_id: str, update: dict):
+    update.setdefault("$set", {})["updated_at"] = datetime.now()
+    result = await db.user_stats.update_one({"_id": user_id}, update)
+    if result.matched_count == 0:
+        # No document yet: the write this call reports is already in the
+        # collections, so a rebuild picks it up along with everything older
+        await rebuild_user_stats(db, user_id)
+
+async def record_goal_change(db, user_id: str, before: dict = None, after: dict = None):
+    """Account for a goal being created (before=None), changed, or deleted (after=None)."""
+    inc = goal_stats_delta(before, after)
+    if inc:
+        await _apply(db, user_id, {"$inc": inc})
+
+async def record_goal_changes(db, user_id: str, changes: list):
+    """Account for several goal changes, given as (before, after) pairs, with one update."""
+    inc = Counter()
+    for before, after in changes:
+        inc.update(goal_stats_delta(before, after))
+    inc = {field: value for field, value in inc.items() if value}
+    if inc:
+        await _apply(db, user_id, {"$inc": inc})
+
+async def record_checkins(db, user_id: str, last_checkin_at: datetime, count: int = 1):
+    await _apply(db, user_id, {"$inc": {"checkins_total": count}, "$max": {"last_checkin_at": last_checkin_at}})
+
+def _goal_stats_pipeline(match: dict) -> list:
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "status": {"$ifNull": ["$status", "not_started"]}},
+            "goals": {"$sum": 1},
+            "progress": {"$sum": {"$ifNull": ["$progress", 0]}},
+            "completed": {"$sum": {"$ifNull": ["$completed_count", {"$size": {"$filter": {
+                "input": {"$ifNull": ["$milestones", []]},
+                "as": "m",
+                "cond": {"$eq": ["$$m.status", "completed"]}
+            }}}]}}
+        }},
+        {"$group": {
+            "_id": "$_id.user_id",
+            "goals_total": {"$sum": "$goals"},
+            "goals_by_status": {"$push": {"k": "$_id.status", "v": "$goals"}},
+            "progress_total": {"$sum": "$progress"},
+            "milestones_completed": {"$sum": "$completed"}
+        }},
+        {"$set": {"goals_by_status": {"$arrayToObject": "$goals_by_status"}}}
+    ]
+
+def _checkin_stats_pipeline(match: dict) -> list:
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": "$user_id",
+            "checkins_total": {"$sum": 1},
+            "last_checkin_at": {"$max": "$checkin_date"}
+        }}
+    ]
+
+def _empty_stats(user_id: str) -> dict:
+    return {
+        "_id": user_id,
+        "goals_total": 0,
+        "goals_by_status": {},
+        "progress_total": 0,
+        "milestones_completed": 0,
+        "checkins_total": 0
+    }
+
+async def rebuild_user_stats(db, user_id: str = None) -> int:
+    """
+    Recompute stats from scratch for one user, or for everyone when
+    user_id is None, and return the number of documents written.
+
+    A full rebuild also removes documents for users that no longer have
+    any goals or check-ins.
+    """
+    match = {"user_id": user_id} if user_id is not None else {}
+    started = datetime.now()
+
+    stats = {}
+    if user_id is not None:
+        stats[user_id] = _empty_stats(user_id)
+    async for row in db.goals.aggregate(_goal_stats_pipeline(match)):
+        stats.setdefault(row["_id"], _empty_stats(row["_id"])).update(row)
+    async for row in db.checkins.aggregate(_checkin_stats_pipeline(match)):
+        stats.setdefault(row["_id"], _empty_stats(row["_id"])).update(row)
+
+    requests = []
+    for doc in stats.values():
+        doc.update(updated_at=started, rebuilt_at=started)
+        requests.append(ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+    for i in range(0, len(requests), REBUILD_BATCH_SIZE):
+        await db.user_stats.bulk_write(requests[i:i + REBUILD_BATCH_SIZE], ordered=False)
+
+    if user_id is None:
+        await db.user_stats.delete_many({"$or": [
+            {"rebuilt_at": {"$lt": started}},
+            {"rebuilt_at": {"$exists": False}}
+        ]})
+    return len(requests)
+
+def format_user_stats(doc: dict) -> dict:
+    goals_total = doc.get("goals_total", 0)
+    progress_total = doc.get("progress_total", 0)
+    by_status = doc.get("goals_by_status") or {}
+    return {
+        "goals_total": goals_total,
+        "goals_by_status": {status: by_status.get(status, 0) for status in GOAL_STATUSES},
+        "progress_total": progress_total,
+        "progress_average": round(progress_total / goals_total, 1) if goals_total else 0,
+        "milestones_completed": doc.get("milestones_completed", 0),
+        "checkins_total": doc.get("checkins_total", 0),
+        "last_checkin_at": doc.get("last_checkin_at"),
+        "updated_at": doc.get("updated_at")
+    }
+
+async def get_user_stats(db, user_id: str) -> dict:
+    doc = await db.user_stats.find_one({"_id": user_id})
+    if doc is None:
+        await rebuild_user_stats(db, user_id)
+        doc = await db.user_stats.find_one({"_id": user_id}) or _empty_stats(user_id)
+    return format_user_stats(doc)
+
+async def _main(user_id: str = None) -> int:
+    from app.database import get_database
+
+    written = await rebuild_user_stats(get_database(), user_id)
+    print(f"✅ Rebuilt stats for {written} user(s)")
+    return 0
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    user = args[args.index("--user") + 1] if "--user" in args else None
+    sys.exit(asyncio.run(_main(user)))
@@ -0,0 +1,154 @@
+"""
+Admission control fairness check.
+
+Runs in-process against app.admission, no server or database needed.
+
+1. rate: on a simulated clock, --users users each ask at a steady pace
+   within their rate while one heavy user asks --heavy-factor times as
+   often. Every light request must be admitted, and the heavy user must
+   get no more than burst + rate * elapsed.
+2. contention: light users drive tutor-style calls through an LLMGateway
+   on the fake provider with a small global pending cap, once alone and
+   once next to a heavy user running --heavy-factor parallel clients that
+   barely pause. With the heavy user present, light users must keep at least
+   1 - --max-slowdown of their completions, Jain's fairness index over
+   them must be at least --min-fairness, and the heavy user must stay
+   within its token bucket.
+
+Exits with status 1 if a check fails.
+
+Usage:
+    python -m benchmarks.admission_fairness --users 20 --heavy-factor 20 --seconds 120
+"""
+import argparse
+import asyncio
+import sys
+
+from app.admission import AdmissionController, MemoryLimiterBackend, Rejected
+from app.llm import LLMGateway, FakeLLMProvider, LLMError, set_provider
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def jain_index(values):
+    values = list(values)
+    if not values or not any(values):
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values))
+
+
+async def check_rate(args, failures):
+    clock = FakeClock()
+    burst, rate = 10, 10 / 60
+    admission = AdmissionController(MemoryLimiterBackend(clock=clock), {"tutor": (burst, rate)},
+                                    max_pending=0, enabled=True)
+    light_interval = 1 / (rate * 0.9)  # just under the refill rate
+    heavy_interval = light_interval / args.heavy_factor
+    admitted, asked = {}, {}
+
+    events = []
+    for user in range(args.users):
+        events += [(i * light_interval + user * 0.01, f"light-{user}") for i in range(int(args.seconds / light_interval))]
+    events += [(i * heavy_interval, "heavy") for i in range(int(args.seconds / heavy_interval))]
+    for at, user in sorted(events):
+        clock.now = at
+        asked[user] = asked.get(user, 0) + 1
+        try:
+            await admission.admit(user, "tutor")
+            admitted[user] = admitted.get(user, 0) + 1
+        except Rejected:
+            pass
+
+    light = [f"light-{user}" for user in range(args.users)]
+    refused = sum(asked[user] - admitted.get(user, 0) for user in light)
+    allowance = burst + rate * args.seconds
+    print(f"rate: light users admitted {sum(admitted.get(u, 0) for u in light)}/{sum(asked[u] for u in light)}, "
+          f"heavy admitted {admitted.get('heavy', 0)}/{asked['heavy']} (allowance {allowance:.0f})")
+    if refused:
+        failures.append(f"rate: {refused} light-user requests were refused")
+    if admitted.get("heavy", 0) > allowance:
+        failures.append(f"rate: heavy user got {admitted['heavy']} requests, over its allowance of {allowance:.0f}")
+
+
+async def contend(args, heavy):
+    """Run light users (and optionally the heavy one) through a gateway; return completions per user."""
+    set_provider(FakeLLMProvider(latency=args.latency))
+    gateway = LLMGateway(max_concurrency=args.concurrency, max_concurrency_per_user=2, timeout=30)
+    admission = AdmissionController(
+        MemoryLimiterBackend(), {"tutor": (args.tutor_rate, args.tutor_rate)}, max_pending=args.max_pending,
+        max_pending_per_user=args.max_pending_per_user, pending=lambda: gateway.in_flight + gateway.waiting,
+        user_pending=gateway.user_pending, enabled=True
+    )
+    completed = {}
+    stop = asyncio.get_running_loop().time() + args.contention_seconds
+
+    async def client(user, interval):
+        while asyncio.get_running_loop().time() < stop:
+            try:
+                await admission.admit(user, "tutor")
+                await gateway.complete([{"role": "user", "content": "question"}], max_tokens=50, user_id=user)
+                completed[user] = completed.get(user, 0) + 1
+            except (Rejected, LLMError):
+                pass
+            await asyncio.sleep(interval)
+
+    light_interval = 0.05
+    clients = [client(f"light-{user}", light_interval) for user in range(args.users)]
+    if heavy:
+        # Many parallel clients retrying almost without pause, ignoring Retry-After
+        clients += [client("heavy", 0.001) for _ in range(args.heavy_factor)]
+    await asyncio.gather(*clients)
+    return completed, admission.stats()
+
+
+async def check_contention(args, failures):
+    baseline, _ = await contend(args, heavy=False)
+    completed, stats = await contend(args, heavy=True)
+
+    light = [completed.get(f"light-{user}", 0) for user in range(args.users)]
+    before = sum(baseline.values()) / args.users
+    after = sum(light) / args.users
+    fairness = jain_index(light)
+    allowance = args.tutor_rate * (1 + args.contention_seconds)
+    print(f"contention: light mean {before:.1f} -> {after:.1f} completions with the heavy user "
+          f"(min {min(light)}, max {max(light)}, fairness {fairness:.3f}), heavy {completed.get('heavy', 0)} "
+          f"(allowance {allowance:.0f}), limited {stats['limited']}, shed {stats['shed']}")
+    if fairness < args.min_fairness:
+        failures.append(f"contention: fairness index {fairness:.3f} below {args.min_fairness}")
+    if after < before * (1 - args.max_slowdown):
+        failures.append(f"contention: light users dropped from {before:.1f} to {after:.1f} completions")
+    if completed.get("heavy", 0) > allowance:
+        failures.append(f"contention: heavy user got {completed['heavy']} completions, over {allowance:.0f}")
+
+
+async def main(args):
+    failures = []
+    await check_rate(args, failures)
+    await check_contention(args, failures)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: admission is fair across users")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--heavy-factor", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=120, help="simulated seconds for the rate check")
+    parser.add_argument("--contention-seconds", type=float, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-pending", type=int, default=16)
+    parser.add_argument("--max-pending-per-user", type=int, default=4)
+    parser.add_argument("--tutor-rate", type=float, default=20, help="per-user requests/s in the contention check")
+    parser.add_argument("--min-fairness", type=float, default=0.9)
+    parser.add_argument("--max-slowdown", type=float, default=0.3)
+    sys.exit(asyncio.run(main(parser.parse_args())))
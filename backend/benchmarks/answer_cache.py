@@ -0,0 +1,92 @@
+"""
+Tutor answer cache benchmark.
+
+Fills a TutorAnswerCache with --entries generated questions, then times
+exact hits, near-duplicate hits (reworded questions) and misses, and
+reports how many rewordings were matched and how many unrelated or
+confusable questions (the same question about another topic or language)
+were wrongly matched at the configured threshold. Runs in-process, no
+server needed.
+
+Usage:
+    python -m benchmarks.answer_cache --entries 400 --threshold 0.8
+"""
+import argparse
+import random
+import time
+
+from app.answer_cache import TutorAnswerCache
+from benchmarks.login_latency import percentile
+
+TOPICS = ["closure", "decorator", "generator", "list comprehension", "recursion", "binary search", "hash map",
+          "linked list", "promise", "async function", "class inheritance", "REST API", "SQL join", "git rebase",
+          "unit test", "docker container", "big O notation", "event loop", "garbage collector", "pointer"]
+LANGUAGES = ["python", "javascript", "java", "go", "rust", "c++", "typescript", "kotlin"]
+TEMPLATES = ["what is a {topic} in {language}?", "how does a {topic} work in {language}",
+             "can you explain {topic} in {language}", "when should I use a {topic} in {language}?",
+             "give me an example of a {topic} in {language}"]
+# (original, reworded) pairs a learner might plausibly send
+REWORDINGS = [
+    ("what is a {topic} in {language}?", "What's a {topic} in {language}"),
+    ("what is a {topic} in {language}?", "whats the {topic} in {language}??"),
+    ("how does a {topic} work in {language}", "How does a {topic} work in {language}?"),
+    ("how does a {topic} work in {language}", "how does {topic} work in {language}"),
+    ("can you explain {topic} in {language}", "Can you explain the {topic} in {language}, please"),
+]
+
+
+def questions():
+    return [template.format(topic=topic, language=language)
+            for template in TEMPLATES for topic in TOPICS for language in LANGUAGES]
+
+
+def timed(cache, pairs):
+    samples, matched = [], 0
+    for context, question in pairs:
+        start = time.perf_counter()
+        answer = cache.get(context, question)
+        samples.append(time.perf_counter() - start)
+        matched += answer is not None
+    return samples, matched
+
+
+def report(name, samples, matched):
+    print(f"{name:<12} n={len(samples):<6} matched={matched:<6} "
+          f"p50={percentile(samples, 50) * 1e6:7.1f}us  p99={percentile(samples, 99) * 1e6:7.1f}us")
+
+
+def main(args):
+    rng = random.Random(7)
+    cache = TutorAnswerCache(max_entries=args.entries, threshold=args.threshold, context_ttls={})
+    known = questions()
+    rng.shuffle(known)
+    known = known[:args.entries]
+    for question in known:
+        cache.put("learning", question, f"Answer to: {question}")
+
+    stored = set(known)
+    reworded = [(original.format(topic=topic, language=language), rewording.format(topic=topic, language=language))
+                for original, rewording in REWORDINGS for topic in TOPICS for language in LANGUAGES]
+    reworded = [("learning", rewording) for original, rewording in reworded if original in stored]
+    unrelated = [("learning", f"how do I configure {topic} logging for {language} servers on windows")
+                 for topic in TOPICS for language in LANGUAGES]
+    # The same question about another language must not get the stored answer
+    confusable = [("learning", question) for question in questions() if question not in stored]
+
+    report("exact", *timed(cache, [("learning", question) for question in known]))
+    samples, matched = timed(cache, reworded)
+    report("reworded", samples, matched)
+    samples, false_matches = timed(cache, unrelated)
+    report("unrelated", samples, false_matches)
+    samples, confused = timed(cache, confusable)
+    report("confusable", samples, confused)
+    print(f"recall on rewordings {matched / max(1, len(reworded)):.1%}, "
+          f"false matches {(false_matches + confused) / max(1, len(unrelated) + len(confusable)):.1%}, "
+          f"cache {cache.stats()['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=400, help="questions stored, out of 800")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""
+Tutor conversation memory check.
+
+Plays --turns question/answer exchanges into a ConversationStore, the way
+the tutor does, and tracks the estimated size of the history sent with each
+question. The history must never exceed --budget tokens, while resending the
+whole conversation grows with every turn. Also fills a small backend past
+its session and byte caps and checks that it stays within them. Runs
+in-process, no server needed.
+
+Exits with status 1 if a check fails.
+
+Usage:
+    python -m benchmarks.conversation_memory --turns 200 --budget 1200
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from app.conversations import ConversationStore, MemoryConversationBackend, estimate_tokens
+from app.tutor import tutor_messages
+from benchmarks.login_latency import percentile
+
+WORDS = ("closure scope variable function return value loop index list dict key recursion base case stack "
+         "call frame memory pointer object class method instance test assert error exception").split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def text(rng, sentences, words):
+    return " ".join(sentence(rng, words) for _ in range(sentences))
+
+
+def prompt_tokens(messages):
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+async def check_budget(args, failures):
+    rng = random.Random(7)
+    store = ConversationStore(MemoryConversationBackend(), budget=args.budget,
+                              recent_budget=args.recent_budget, summary_mode="extractive", enabled=True)
+    history, full, timings = [], 0, []
+    for turn in range(args.turns):
+        question = text(rng, rng.randint(1, 3), 12)
+        # Every tenth answer is far longer than the whole budget
+        answer = text(rng, 200 if turn % 10 == 9 else rng.randint(2, 8), 15)
+
+        start = time.perf_counter()
+        conversation = await store.load("user", "learning")
+        messages = tutor_messages(question, "learning", conversation)
+        await store.record(conversation, question, answer)
+        timings.append(time.perf_counter() - start)
+
+        history.append(conversation.tokens)
+        if turn in (0, 9, args.turns - 1):
+            print(f"turn {turn + 1:<5} prompt {prompt_tokens(messages):>6} tokens with memory, "
+                  f"{prompt_tokens(tutor_messages(question, 'learning')) + full:>8} resending everything")
+        full += estimate_tokens(question) + estimate_tokens(answer)
+
+    print(f"history tokens: max {max(history)}, budget {args.budget}; compactions {store.compactions}; "
+          f"load+record p50 {percentile(timings, 50) * 1e6:.1f}us p99 {percentile(timings, 99) * 1e6:.1f}us")
+    if max(history) > args.budget:
+        failures.append(f"budget: history reached {max(history)} tokens, over {args.budget}")
+
+
+async def check_caps(args, failures):
+    backend = MemoryConversationBackend(max_sessions=args.sessions, max_bytes=args.sessions * 2000, idle_ttl=3600)
+    store = ConversationStore(backend, budget=args.budget, recent_budget=args.recent_budget, enabled=True)
+    rng = random.Random(11)
+    for user in range(args.sessions * 3):
+        conversation = await store.load(f"user-{user}", "learning")
+        await store.record(conversation, text(rng, 1, 12), text(rng, rng.randint(2, 30), 15))
+    stats = backend.stats()
+    print(f"caps: {stats['sessions']} sessions (max {stats['max_sessions']}), {stats['bytes']} bytes "
+          f"(max {stats['max_bytes']}), evictions {stats['evictions']}")
+    if stats["sessions"] > stats["max_sessions"] or stats["bytes"] > stats["max_bytes"]:
+        failures.append("caps: backend grew past its session or byte cap")
+
+
+async def main(args):
+    failures = []
+    await check_budget(args, failures)
+    await check_caps(args, failures)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: conversation memory stays within its budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=1200, help="history tokens: summary plus recent turns")
+    parser.add_argument("--recent-budget", type=int, default=800)
+    parser.add_argument("--sessions", type=int, default=500, help="session cap for the caps check")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,128 @@
+"""
+Goal search index benchmark.
+
+Builds the in-process search index (app.search.UserIndex) for one user with
+each of --sizes goals of generated 12-week plans, then times searches for
+specific terms (a goal's own topic, matching a handful of goals) and broad
+ones (a category word shared by a large share of them), plus incremental
+reindexing of a changed goal. Neither kind of search may get more than
+--max-growth times slower (median) from the smallest size to the largest.
+Also pages through a search whose --tied goals all score the same, the way
+GET /api/goals/search does, and checks every goal comes back exactly once. Runs
+in-process, no server or database needed; the MongoDB backend's latency
+depends on the text index and is covered by the load test.
+
+Exits with status 1 if the check fails.
+
+Usage:
+    python -m benchmarks.goal_search --sizes 100 1000 5000 --queries 500
+"""
+import argparse
+import random
+import sys
+import time
+
+from bson import ObjectId
+
+from app.search import UserIndex, terms
+from benchmarks.login_latency import percentile
+
+CATEGORIES = ["programming", "fitness", "languages", "music", "design", "finance", "cooking", "writing"]
+WORDS = ("practice review project basics advanced build study plan read notes exercise session skills test "
+         "daily weekly routine progress lesson chapter course guide").split()
+
+
+def topic(i):
+    # Made-up words so each topic matches only the goals generated for it
+    return f"topic{i}"
+
+
+def make_goal(rng, i, topics):
+    own = topic(rng.randrange(topics))
+    return {
+        "_id": ObjectId(),
+        "title": f"Learn {own} {rng.choice(WORDS)}",
+        "description": " ".join(rng.choice(WORDS) for _ in range(20)),
+        "category": rng.choice(CATEGORIES),
+        "milestones": [{"objective": f"{own} " + " ".join(rng.choice(WORDS) for _ in range(8))}
+                       for _ in range(12)]
+    }
+
+
+def timed(index, queries, count):
+    samples = []
+    for query in queries:
+        query_terms = terms(query)
+        start = time.perf_counter()
+        index.search(query_terms, count)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def check_paging(args):
+    """True if paging through a search with all-tied scores returns each goal exactly once."""
+    index = UserIndex(0)
+    for _ in range(args.tied):
+        index.add({"_id": ObjectId(), "title": "Learn Python"})
+    query_terms = terms("python")
+    seen = []
+    for offset in range(0, args.tied, args.limit):
+        # Same slicing as GoalSearch._search_memory
+        seen += [goal_id for goal_id, _ in index.search(query_terms, offset + args.limit)[offset:]]
+    if len(seen) != args.tied or len(set(seen)) != args.tied:
+        print(f"FAIL: paging {args.tied} tied goals returned {len(set(seen))} distinct in {len(seen)} results")
+        return False
+    print(f"OK: paging {args.tied} tied goals returned each once")
+    return True
+
+
+def main(args):
+    rng = random.Random(7)
+    p50 = {"specific": {}, "broad": {}}
+    for size in args.sizes:
+        # A fixed number of goals per topic, so a specific search matches about as many goals at every size
+        topics = max(1, size // 5)
+        goals = [make_goal(rng, i, topics) for i in range(size)]
+        start = time.perf_counter()
+        index = UserIndex(0)
+        for goal in goals:
+            index.add(goal)
+        build = time.perf_counter() - start
+
+        specific = timed(index, [f"{topic(rng.randrange(topics))} practice" for _ in range(args.queries)], args.limit)
+        broad = timed(index, [rng.choice(CATEGORIES) for _ in range(args.queries)], args.limit)
+        reindex = []
+        for goal in rng.sample(goals, min(args.queries, len(goals))):
+            goal["title"] += " updated"
+            start = time.perf_counter()
+            index.add(goal)
+            reindex.append(time.perf_counter() - start)
+
+        # Medians are compared; microsecond p99s move too much with GC and timer noise
+        p50["specific"][size] = percentile(specific, 50)
+        p50["broad"][size] = percentile(broad, 50)
+        print(f"{size:>6} goals  build {build * 1e3:7.1f}ms  "
+              f"specific p50 {p50['specific'][size] * 1e6:7.1f}us p99 {percentile(specific, 99) * 1e6:7.1f}us  "
+              f"broad p50 {p50['broad'][size] * 1e6:8.1f}us p99 {percentile(broad, 99) * 1e6:8.1f}us  "
+              f"reindex p50 {percentile(reindex, 50) * 1e6:6.1f}us")
+
+    smallest, largest = min(args.sizes), max(args.sizes)
+    failed = not check_paging(args)
+    for kind, by_size in p50.items():
+        growth = by_size[largest] / by_size[smallest]
+        if growth > args.max_growth:
+            print(f"FAIL: {kind} searches got {growth:.1f}x slower from {smallest} to {largest} goals")
+            failed = True
+        else:
+            print(f"OK: {kind} searches {growth:.1f}x from {smallest} to {largest} goals")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="goals per user")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20, help="results per page")
+    parser.add_argument("--max-growth", type=float, default=3.0)
+    parser.add_argument("--tied", type=int, default=103, help="equally scored goals for the paging check")
+    sys.exit(main(parser.parse_args()))
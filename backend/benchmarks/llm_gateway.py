@@ -0,0 +1,66 @@
+"""
+Offline LLM gateway throughput benchmark.
+
+Drives the LLM gateway against the in-process fake provider. For each
+combination of fake latency and global concurrency limit, it prints
+completions/s and end-to-end latency percentiles, including time spent
+waiting for a slot.
+
+Usage:
+    python -m benchmarks.llm_gateway --calls 500 --users 50 --latency 0.2 1.0 --concurrency 8 32
+"""
+import argparse
+import asyncio
+import time
+
+from app.llm import LLMGateway, FakeLLMProvider, LLMError, set_provider
+from benchmarks.login_latency import percentile
+
+
+async def run(latency, concurrency, args):
+    set_provider(FakeLLMProvider(latency=latency, failure_rate=args.failure_rate))
+    gateway = LLMGateway(max_concurrency=concurrency, max_concurrency_per_user=args.per_user,
+                         timeout=args.timeout, retry_delay=0.05)
+    samples, errors = [], 0
+
+    async def call(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await gateway.complete([{"role": "user", "content": f"question {i}"}], max_tokens=150,
+                                   user_id=f"user-{i % args.users}")
+        except LLMError:
+            errors += 1
+        samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(args.calls)))
+    elapsed = time.perf_counter() - start
+
+    stats = gateway.stats()
+    print(
+        f"latency={latency:<5} concurrency={concurrency:<4} "
+        f"rps={args.calls / elapsed:8.1f}  "
+        f"p50={percentile(samples, 50) * 1000:8.1f}ms  "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms  "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms  "
+        f"errors={errors} retries={stats['retries']} tokens={stats['prompt_tokens'] + stats['completion_tokens']}"
+    )
+
+
+async def main(args):
+    for latency in args.latency:
+        for concurrency in args.concurrency:
+            await run(latency, concurrency, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--per-user", type=int, default=2)
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.2, 1.0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(main(parser.parse_args()))
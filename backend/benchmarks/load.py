@@ -0,0 +1,410 @@
+"""
+Mixed-workload load test for the API and the tutor WebSocket.
+
+Boots benchmarks.server (fake LLM, in-memory or local MongoDB) in a child
+process, or targets a running server with --base-url. It registers --users
+users, each with --goals goals, then `concurrency` workers run operations
+back to back for --duration seconds. Each worker picks an operation by the
+weights in --mix and a random user. The first --warmup seconds are not
+recorded.
+
+Operations: register, login, list_goals, get_goal, create_goal,
+update_goal, delete_goal, milestone, checkin, progress, tutor (a question
+over a WebSocket, timed until the answer arrives).
+
+--mongo defaults to local when MONGODB_URL is set. The in-memory stand-in
+cannot run milestone updates, so that operation is only measured with
+--mongo local or --base-url; a memory run lists it under "excluded" in its
+settings.
+
+Results are written as JSON: per operation count, errors, status codes,
+req/s and p50/p95/p99, plus the git commit and the settings used. Keep
+one file per commit and compare two with --compare, which warns when the
+two runs used different operation mixes.
+
+Usage:
+    python -m benchmarks.load --mongo memory --concurrency 50 --duration 30 --output before.json
+    python -m benchmarks.load --base-url http://localhost:8000 --mix list_goals=5,milestone=2,tutor=1
+    python -m benchmarks.load --compare before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+
+from benchmarks.login_latency import percentile
+from benchmarks.server import default_mongo
+
+DEFAULT_MIX = ("login=1,list_goals=6,get_goal=6,create_goal=1,update_goal=1,delete_goal=1,"
+               "milestone=3,checkin=2,progress=1,tutor=1")
+PASSWORD = "benchmark-password"
+
+
+class User:
+    def __init__(self, email, headers, user_id):
+        self.email = email
+        self.headers = headers
+        self.user_id = user_id
+        self.goals = []
+
+
+async def register(client, tag="bench"):
+    email = f"{tag}-{uuid.uuid4().hex[:12]}@example.com"
+    response = await client.post("/api/auth/register", json={"name": "Bench", "email": email, "password": PASSWORD})
+    if response.status_code >= 400:
+        return response, None
+    body = response.json()
+    return response, User(email, {"Authorization": f"Bearer {body['access_token']}"}, body["user"]["id"])
+
+
+async def create_goal(client, user, duration=12):
+    response = await client.post("/api/goals", headers=user.headers, json={
+        "title": f"Benchmark goal {uuid.uuid4().hex[:6]}",
+        "description": "Created by benchmarks.load",
+        "category": "programming",
+        "complexity": "intermediate",
+        "duration": duration
+    })
+    if response.status_code < 400:
+        user.goals.append(response.json()["goal"]["_id"])
+    return response
+
+
+class Workload:
+    """The operations a worker can run; each returns a status code (101 for a tutor answer)."""
+
+    def __init__(self, client, base_url, users, args):
+        self.client = client
+        self.ws_url = base_url.replace("http", "ws", 1)
+        self.users = users
+        self.args = args
+        self.sockets = {}  # worker -> open tutor WebSocket
+
+    async def register(self, worker, user):
+        response, _ = await register(self.client, "bench-new")
+        return response.status_code
+
+    async def login(self, worker, user):
+        response = await self.client.post("/api/auth/login", json={"email": user.email, "password": PASSWORD})
+        return response.status_code
+
+    async def list_goals(self, worker, user):
+        return (await self.client.get("/api/goals", headers=user.headers)).status_code
+
+    async def get_goal(self, worker, user):
+        if not user.goals:
+            return await self.create_goal(worker, user)
+        goal_id = random.choice(user.goals)
+        return (await self.client.get(f"/api/goals/{goal_id}", headers=user.headers)).status_code
+
+    async def create_goal(self, worker, user):
+        return (await create_goal(self.client, user, self.args.weeks)).status_code
+
+    async def update_goal(self, worker, user):
+        if not user.goals:
+            return await self.create_goal(worker, user)
+        goal_id = random.choice(user.goals)
+        response = await self.client.put(f"/api/goals/{goal_id}", headers=user.headers,
+                                         json={"description": f"Updated {time.time()}"})
+        return response.status_code
+
+    async def delete_goal(self, worker, user):
+        # Keep every user's goal count steady so reads stay comparable over the run
+        if len(user.goals) <= self.args.goals:
+            return await self.create_goal(worker, user)
+        goal_id = user.goals.pop(random.randrange(len(user.goals)))
+        return (await self.client.delete(f"/api/goals/{goal_id}", headers=user.headers)).status_code
+
+    async def milestone(self, worker, user):
+        if not user.goals:
+            return await self.create_goal(worker, user)
+        goal_id = random.choice(user.goals)
+        week = random.randint(1, self.args.weeks)
+        status = random.choice(["not_started", "in_progress", "completed"])
+        response = await self.client.put(f"/api/goals/{goal_id}/milestone/{week}", headers=user.headers,
+                                         json={"status": status})
+        return response.status_code
+
+    async def checkin(self, worker, user):
+        if not user.goals:
+            return await self.create_goal(worker, user)
+        response = await self.client.post("/api/checkins", headers=user.headers, json={
+            "goal_id": random.choice(user.goals),
+            "progress_notes": "Benchmark check-in",
+            "challenges": "",
+            "next_steps": "Keep going"
+        })
+        return response.status_code
+
+    async def progress(self, worker, user):
+        return (await self.client.get("/api/progress/summary", headers=user.headers)).status_code
+
+    async def tutor(self, worker, user):
+        # One socket per worker, reused like a browser tab would
+        socket = self.sockets.get(worker)
+        if socket is None:
+            socket = self.sockets[worker] = await websockets.connect(
+                f"{self.ws_url}/ws/tutor/{user.user_id}?token={user.headers['Authorization'].split()[1]}"
+            )
+        try:
+            await socket.send(json.dumps({
+                "type": "user_message",
+                "message": "How should I structure this week's practice?",
+                "timestamp": datetime.now().isoformat()
+            }))
+            while True:
+                message = json.loads(await asyncio.wait_for(socket.recv(), self.args.timeout))
+                if message.get("type") == "ai_response":
+                    return 101
+                if message.get("type") == "error":
+                    return 503
+        except BaseException:
+            self.sockets.pop(worker, None)
+            await socket.close()
+            raise
+
+    async def close(self):
+        for socket in self.sockets.values():
+            await socket.close()
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if not hasattr(Workload, name) or name.startswith("_") or name == "close":
+            raise SystemExit(f"unknown operation in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def summarize(samples, statuses, errors, elapsed):
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2) if samples else 0.0,
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+        "statuses": dict(sorted(statuses.items()))
+    }
+
+
+async def drive(workload, mix, args):
+    names, weights = list(mix), list(mix.values())
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    started = time.perf_counter()
+    record_from = started + args.warmup
+    stop_at = record_from + args.duration
+
+    async def worker(index):
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                return
+            name = random.choices(names, weights)[0]
+            user = random.choice(workload.users)
+            try:
+                status = await getattr(workload, name)(index, user)
+                failed = status >= 400
+            except Exception as e:
+                status, failed = type(e).__name__, True
+            if now >= record_from:
+                samples[name].append(time.perf_counter() - now)
+                statuses[name][str(status)] += 1
+                errors[name] += failed
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - record_from
+
+    everything = [sample for values in samples.values() for sample in values]
+    return {
+        "total": summarize(everything, sum(statuses.values(), Counter()), sum(errors.values()), elapsed),
+        "operations": {name: summarize(samples[name], statuses[name], errors[name], elapsed) for name in sorted(samples)}
+    }
+
+
+async def setup_users(client, args):
+    users = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with semaphore:
+            response, user = await register(client)
+            response.raise_for_status()
+            for _ in range(args.goals):
+                (await create_goal(client, user, args.weeks)).raise_for_status()
+            users.append(user)
+
+    await asyncio.gather(*(one() for _ in range(args.users)))
+    return users
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(args):
+    command = [sys.executable, "-m", "benchmarks.server", "--port", str(args.port), "--mongo", args.mongo,
+               "--llm-latency", str(args.llm_latency), "--llm-failure-rate", str(args.llm_failure_rate)]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+async def wait_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise SystemExit(f"benchmark server exited with status {process.returncode}")
+            try:
+                if (await client.get("/api/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"{base_url} was not ready within {timeout}s")
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    excluded = []
+    if args.base_url is None and args.mongo == "memory" and mix.pop("milestone", None):
+        excluded.append("milestone")
+        print("note: mongomock cannot run the milestone update pipeline ($mergeObjects), "
+              "so milestone is left out; use --mongo local to include it", file=sys.stderr)
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process = start_server(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        await wait_ready(base_url, process)
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            users = await setup_users(client, args)
+            workload = Workload(client, base_url, users, args)
+            try:
+                results = await drive(workload, mix, args)
+            finally:
+                await workload.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": {
+            "target": args.base_url or f"benchmarks.server --mongo {args.mongo}",
+            "llm_latency": None if args.base_url else args.llm_latency,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "users": args.users,
+            "goals": args.goals,
+            "weeks": args.weeks,
+            "mix": mix,
+            "excluded": excluded
+        },
+        **results
+    }
+
+
+def print_table(report, out=sys.stderr):
+    rows = [("total", report["total"])] + list(report["operations"].items())
+    for name, row in rows:
+        print(
+            f"{name:<12} n={row['requests']:<7} errors={row['errors']:<5} "
+            f"rps={row['rps']:8.1f}  p50={row['p50_ms']:7.1f}ms  "
+            f"p95={row['p95_ms']:7.1f}ms  p99={row['p99_ms']:7.1f}ms",
+            file=out
+        )
+
+
+def compare(before_path, after_path):
+    """Print the change in req/s and tail latency per operation between two result files."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    if before.get("settings", {}).get("mix") != after.get("settings", {}).get("mix"):
+        print(f"warning: the runs used different operation mixes (excluded: "
+              f"{before.get('settings', {}).get('excluded', [])} before, "
+              f"{after.get('settings', {}).get('excluded', [])} after), so totals are not comparable",
+              file=sys.stderr)
+
+    def change(old, new):
+        return round((new - old) / old * 100, 1) if old else None
+
+    rows = {}
+    for name in ["total"] + sorted(set(before["operations"]) | set(after["operations"])):
+        old = before["total"] if name == "total" else before["operations"].get(name)
+        new = after["total"] if name == "total" else after["operations"].get(name)
+        if old is None or new is None:
+            continue
+        rows[name] = {key: {"before": old[key], "after": new[key], "change_pct": change(old[key], new[key])}
+                      for key in ("rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")}
+        print(
+            f"{name:<12} rps {old['rps']:8.1f} -> {new['rps']:8.1f} ({rows[name]['rps']['change_pct']}%)  "
+            f"p99 {old['p99_ms']:7.1f} -> {new['p99_ms']:7.1f}ms ({rows[name]['p99_ms']['change_pct']}%)",
+            file=sys.stderr
+        )
+    print(json.dumps({"before": before.get("commit"), "after": after.get("commit"), "operations": rows}, indent=2))
+
+
+def main(args):
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    report = asyncio.run(run(args))
+    print_table(report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if report["total"]["requests"] == 0 else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="benchmark a running server instead of starting benchmarks.server")
+    parser.add_argument("--mongo", choices=["memory", "local"], default=default_mongo())
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--goals", type=int, default=5, help="goals created per user before the run")
+    parser.add_argument("--weeks", type=int, default=12, help="milestones per created goal")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight pairs, comma separated")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two JSON reports")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Login latency benchmark.
+
+Runs a stream of logins alongside a stream of authenticated GET /api/goals
+requests against a running server and prints p50/p95/p99 latency for each.
+Before bcrypt moved off the event loop, the goals requests would inherit
+the full hashing time of every concurrent login.
+
+Usage (server running on localhost:8000):
+    python -m benchmarks.login_latency --logins 200 --reads 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, samples, errors, elapsed):
+    print(
+        f"{name:<12} n={len(samples):<6} errors={errors:<4} "
+        f"rps={len(samples) / elapsed:8.1f}  "
+        f"p50={percentile(samples, 50) * 1000:7.1f}ms  "
+        f"p95={percentile(samples, 95) * 1000:7.1f}ms  "
+        f"p99={percentile(samples, 99) * 1000:7.1f}ms  "
+        f"mean={(statistics.mean(samples) if samples else 0) * 1000:7.1f}ms"
+    )
+
+
+async def run_requests(count, concurrency, send):
+    samples, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(count):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await send()
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, errors
+
+
+async def main(args):
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    password = "benchmark-password"
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        response = await client.post("/api/auth/register", json={"name": "Bench", "email": email, "password": password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        async def login():
+            return await client.post("/api/auth/login", json={"email": email, "password": password})
+
+        async def read_goals():
+            return await client.get("/api/goals", headers=headers)
+
+        start = time.perf_counter()
+        (login_samples, login_errors), (read_samples, read_errors) = await asyncio.gather(
+            run_requests(args.logins, args.concurrency, login),
+            run_requests(args.reads, args.concurrency, read_goals),
+        )
+        elapsed = time.perf_counter() - start
+
+    summarize("login", login_samples, login_errors, elapsed)
+    summarize("GET goals", read_samples, read_errors, elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
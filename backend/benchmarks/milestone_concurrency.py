@@ -0,0 +1,130 @@
+"""
+Concurrent milestone update check.
+
+Creates a goal on a running server, waits for its learning journey to be
+generated (up to --journey-timeout seconds), then fires milestone updates
+in parallel:
+
+1. one update per week, all at once, marking every week completed; every
+   one of them must survive (no lost updates) and progress must reach 100.
+2. a burst of random status changes across all weeks; afterwards the
+   maintained completed/in-progress counters and progress must still match
+   a recount of the milestones.
+
+Exits with status 1 if either check fails, or if the goal ends up with no
+milestones to update.
+
+Usage (server running on localhost:8000):
+    python -m benchmarks.milestone_concurrency --weeks 52 --updates 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+
+import httpx
+
+STATUSES = ["not_started", "in_progress", "completed"]
+JOURNEY_DONE = ("ready", "fallback")
+
+
+async def wait_for_journey(client, headers, goal_id, timeout):
+    """Poll the journey status until the milestones are in; returns the last status seen."""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = await client.get(f"/api/goals/{goal_id}/journey", headers=headers)
+        response.raise_for_status()
+        status = response.json()["status"]
+        if status in JOURNEY_DONE or time.monotonic() >= deadline:
+            return status
+        await asyncio.sleep(0.2)
+
+
+async def fire(client, headers, goal_id, updates, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(week, status):
+        async with semaphore:
+            response = await client.put(f"/api/goals/{goal_id}/milestone/{week}", json={"status": status}, headers=headers)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(week, status) for week, status in updates))
+    return time.perf_counter() - start
+
+
+def check_counters(goal):
+    milestones = goal["milestones"]
+    completed = sum(1 for m in milestones if m.get("status") == "completed")
+    in_progress = sum(1 for m in milestones if m.get("status") == "in_progress")
+    expected_progress = int((completed / len(milestones)) * 100) if milestones else 0
+
+    problems = []
+    if goal.get("completed_count") != completed:
+        problems.append(f"completed_count={goal.get('completed_count')} but {completed} milestones are completed")
+    if goal.get("in_progress_count") != in_progress:
+        problems.append(f"in_progress_count={goal.get('in_progress_count')} but {in_progress} milestones are in progress")
+    if goal.get("progress") != expected_progress:
+        problems.append(f"progress={goal.get('progress')} but expected {expected_progress}")
+    return problems
+
+
+async def main(args):
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    failures = []
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        response = await client.post("/api/auth/register", json={"name": "Bench", "email": email, "password": "benchmark-password"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        response = await client.post("/api/goals", json={"title": "Concurrency check", "duration": args.weeks}, headers=headers)
+        response.raise_for_status()
+        goal_id = response.json()["goal"]["_id"]
+
+        async def fetch_goal():
+            response = await client.get(f"/api/goals/{goal_id}", headers=headers)
+            response.raise_for_status()
+            return response.json()["goal"]
+
+        status = await wait_for_journey(client, headers, goal_id, args.journey_timeout)
+        weeks = [m["week"] for m in (await fetch_goal())["milestones"]]
+        if not weeks:
+            await client.delete(f"/api/goals/{goal_id}", headers=headers)
+            print(f"FAIL: goal has no milestones to update (journey status {status!r})")
+            return 1
+
+        elapsed = await fire(client, headers, goal_id, [(week, "completed") for week in weeks], args.concurrency)
+        goal = await fetch_goal()
+        lost = [m["week"] for m in goal["milestones"] if m.get("status") != "completed"]
+        print(f"parallel completion: {len(weeks)} updates in {elapsed * 1000:.0f}ms, progress={goal['progress']}")
+        if lost:
+            failures.append(f"lost updates for weeks {lost}")
+        failures.extend(check_counters(goal))
+
+        updates = [(random.choice(weeks), random.choice(STATUSES)) for _ in range(args.updates)]
+        elapsed = await fire(client, headers, goal_id, updates, args.concurrency)
+        goal = await fetch_goal()
+        print(f"random burst: {len(updates)} updates in {elapsed * 1000:.0f}ms "
+              f"({len(updates) / elapsed:.0f} updates/s), progress={goal['progress']}")
+        failures.extend(check_counters(goal))
+
+        await client.delete(f"/api/goals/{goal_id}", headers=headers)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: no lost updates, counters consistent")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--journey-timeout", type=float, default=60, help="seconds to wait for milestones")
+    sys.exit(asyncio.run(main(parser.parse_args())))
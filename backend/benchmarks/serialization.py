@@ -0,0 +1,106 @@
+"""
+Goal list serialization microbenchmark.
+
+Serializes a page of goals with 52 milestones each, the way GET /api/goals
+used to (converting _id in a Python loop, then jsonable_encoder and
+json.dumps as JSONResponse does) and the way it does now (the precompiled
+GoalPage TypeAdapter's dump_json). Plain orjson on the raw documents is
+shown for reference. Runs in-process, no server or database needed.
+
+Usage:
+    python -m benchmarks.serialization --goals 100 --milestones 52 --rounds 200
+"""
+import argparse
+import copy
+import json
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from app.responses import orjson_default
+from app.schemas.goal import goal_page_adapter
+from benchmarks.login_latency import percentile
+
+
+def make_goals(count, milestones):
+    now = datetime.now()
+    return [{
+        "_id": ObjectId(),
+        "title": f"Learn topic {i}",
+        "description": "A goal with a full year of weekly milestones",
+        "category": "programming",
+        "complexity": "intermediate",
+        "duration": milestones,
+        "progress": 25,
+        "status": "in_progress",
+        "user_id": "benchmark-user",
+        "milestones": [{
+            "week": week,
+            "objective": f"Week {week}: study and practice the next part of topic {i}",
+            "dependencies": [f"Week {week - 1}"] if week > 1 else [],
+            "resources": ["Official documentation", "Practice exercises", "Video course"],
+            "status": "completed" if week <= milestones // 4 else "not_started"
+        } for week in range(1, milestones + 1)],
+        "milestone_count": milestones,
+        "completed_count": milestones // 4,
+        "in_progress_count": 0,
+        "current_week": milestones // 4 + 1,
+        "journey_source": "llm",
+        "created_at": now - timedelta(minutes=i)
+    } for i in range(count)]
+
+
+def legacy_path(goals):
+    for goal in goals:
+        goal["_id"] = str(goal["_id"])
+    content = jsonable_encoder({"goals": goals, "next_cursor": None})
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def adapter_path(goals):
+    return goal_page_adapter.dump_json({"goals": goals, "next_cursor": None})
+
+
+def orjson_path(goals):
+    return orjson.dumps({"goals": goals, "next_cursor": None}, default=orjson_default)
+
+
+def run(name, fn, goals, rounds):
+    # The legacy path rewrites _id in place, so every round gets fresh documents
+    inputs = [copy.deepcopy(goals) for _ in range(rounds)] if fn is legacy_path else [goals] * rounds
+    samples = []
+    for batch in inputs:
+        start = time.perf_counter()
+        body = fn(batch)
+        samples.append(time.perf_counter() - start)
+    print(
+        f"{name:<10} bytes={len(body):<8} "
+        f"p50={percentile(samples, 50) * 1000:8.2f}ms  "
+        f"p95={percentile(samples, 95) * 1000:8.2f}ms  "
+        f"goals/s={len(goals) / (sum(samples) / len(samples)):10.0f}"
+    )
+    return body
+
+
+def main(args):
+    goals = make_goals(args.goals, args.milestones)
+    legacy = run("legacy", legacy_path, goals, args.rounds)
+    adapter = run("adapter", adapter_path, goals, args.rounds)
+    run("orjson", orjson_path, goals, args.rounds)
+
+    if json.loads(legacy) != json.loads(adapter):
+        print("❌ adapter output differs from the legacy path")
+        return 1
+    print("✅ adapter output matches the legacy path")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--goals", type=int, default=100)
+    parser.add_argument("--milestones", type=int, default=52)
+    parser.add_argument("--rounds", type=int, default=200)
+    raise SystemExit(main(parser.parse_args()))
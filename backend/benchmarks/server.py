@@ -0,0 +1,82 @@
+"""
+Benchmark server.
+
+Runs the API under uvicorn with the fake LLM, against a local MongoDB or an
+in-memory stand-in. benchmarks.load starts it on its own; run it by hand to
+profile the server side of a benchmark.
+
+--mongo memory uses mongomock-motor, which is in benchmarks/requirements.txt
+rather than requirements.txt (pip install -r benchmarks/requirements.txt).
+It skips index bootstrap and has no network round trips, so its numbers
+measure the app itself, not MongoDB. It does not support $mergeObjects, so
+milestone updates answer 500.
+--mongo local uses MONGODB_URL with a separate database (--db). It is the
+default when MONGODB_URL is set.
+
+Per-user rate limits and LLM load shedding (app.admission) are off, since a
+handful of benchmark users would otherwise hit them within seconds and the
+rejections would be timed as answers; --admission keeps them on.
+
+Usage:
+    python -m benchmarks.server --port 8765 --mongo memory --llm-latency 0.2
+"""
+import argparse
+import os
+
+
+def use_memory_mongo(db_name):
+    from mongomock.collection import BulkOperationBuilder
+    from mongomock_motor import AsyncMongoMockClient
+    from app import database
+
+    # pymongo 4.9+ passes sort= to bulk replace/update ops, which mongomock does not accept
+    for name in ("add_replace", "add_update"):
+        method = getattr(BulkOperationBuilder, name)
+        setattr(BulkOperationBuilder, name,
+                lambda self, *args, _method=method, sort=None, **kwargs: _method(self, *args, **kwargs))
+
+    # connect() keeps an existing client, so the lifespan picks this one up
+    database.client = AsyncMongoMockClient()
+    database.database = database.client[db_name]
+
+
+def default_mongo():
+    return "local" if os.getenv("MONGODB_URL") else "memory"
+
+
+def main(args):
+    # Settings are read at import time, so the environment is set before app is imported
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.llm_failure_rate)
+    os.environ["MONGODB_DB"] = args.db
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.admission:
+        os.environ["RATE_LIMIT"] = "0"
+        os.environ["LLM_MAX_PENDING"] = "0"
+        os.environ["LLM_MAX_PENDING_PER_USER"] = "0"
+    if args.mongo == "memory":
+        os.environ["INDEX_BOOTSTRAP"] = "0"
+
+    import uvicorn
+    from app.main import app
+
+    if args.mongo == "memory":
+        try:
+            use_memory_mongo(args.db)
+        except ImportError:
+            raise SystemExit("--mongo memory needs mongomock-motor: pip install -r benchmarks/requirements.txt")
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mongo", choices=["memory", "local"], default=default_mongo())
+    parser.add_argument("--db", default="goallab_bench")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true", help="keep rate limits and LLM load shedding on")
+    main(parser.parse_args())
@@ -24,10 +24,15 @@ API.interceptors.response.use(
   }
 );
 
-export const fetchGoals = () => API.get("/goals");
-export const fetchGoal = (id) => API.get(`/goals/${id}`);
+export const fetchGoals = (params) => API.get("/goals", { params });
+export const fetchGoal = (id, params) => API.get(`/goals/${id}`, { params });
 export const createGoal = (goal) => API.post("/goals", goal);
 export const updateGoal = (id, data) => API.put(`/goals/${id}`, data);export const deleteGoal = (id) => API.delete(`/goals/${id}`);
 export const updateMilestone = (goalId, weekNumber, data) => 
   API.put(`/goals/${goalId}/milestone/${weekNumber}`, data);
+export const batchUpdate = (operations, ordered = true) =>
+  API.post("/goals/batch", { operations, ordered });
 export const getGoalProgress = (goalId) => API.get(`/goals/${goalId}/progress`);
+export const searchGoals = (q, params) => API.get("/goals/search", { params: { q, ...params } });
+export const fetchMilestones = (goalId, weeks) =>
+  API.get(`/goals/${goalId}/milestones`, { params: { weeks } });
@@ -32,7 +32,8 @@ export default function TutorChat() {
       return;
     }
 
-    const ws = new WebSocket(`ws://localhost:8000/ws/tutor/${user.id}`);
+    const token = localStorage.getItem('authToken');
+    const ws = new WebSocket(`ws://localhost:8000/ws/tutor/${user.id}?token=${encodeURIComponent(token || '')}`);
     
     ws.onopen = () => {
       console.log('Connected to AI Tutor');
@@ -47,6 +48,14 @@ export default function TutorChat() {
     ws.onmessage = (event) => {
       try {
         const data = JSON.parse(event.data);
+        // Answer server keepalives so the session isn't closed as idle
+        if (data.type === 'ping') {
+          ws.send(JSON.stringify({ type: 'pong' }));
+          return;
+        }
+        if (data.type === 'pong') {
+          return;
+        }
         setMessages(prev => [...prev, {
           type: 'ai',
           message: data.message,
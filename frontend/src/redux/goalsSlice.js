@@ -6,8 +6,15 @@ export const fetchUserGoals = createAsyncThunk(
   'goals/fetchGoals',
   async (_, { rejectWithValue }) => {
     try {
-      const response = await fetchGoals();
-      return response.data.goals;
+      // Follow next_cursor so users with many goals get all of them
+      const goals = [];
+      let after;
+      do {
+        const response = await fetchGoals(after ? { after } : undefined);
+        goals.push(...response.data.goals);
+        after = response.data.next_cursor;
+      } while (after);
+      return goals;
     } catch (error) {
       return rejectWithValue(
         error.response?.data?.detail || error.response?.data?.message || 'Failed to fetch goals'